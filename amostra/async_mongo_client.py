@@ -0,0 +1,365 @@
+import pymongo
+from pymongo import AsyncMongoClient
+
+from .mongo_client import (
+    _check_changes,
+    _facets_pipeline,
+    _facets_result,
+    _reconstruct,
+    _revision_document,
+)
+from .objects import TYPES_TO_COLLECTION_NAMES, Container, Sample
+from .utils import normalize_sort
+
+
+class AsyncClient:
+    """
+    This connects to the amostra MongoDB collections from asyncio code.
+
+    It uses PyMongo's asyncio API, so that queries do not block the event
+    loop, and is meant for serving amostra from an event loop, as the tornado
+    server does.
+
+    Unlike :class:`amostra.mongo_client.Client`, it does not give live,
+    traitlets-based objects, which would need to sync each change as it is
+    made. Instead, searches give read-only records, and changes are made
+    explicitly with ``await accessor.update(uuid, changes)``. Values go in and
+    come out in their JSON-serializable form, as given by ``to_dict()``.
+
+    Documents and their revisions are stored just as
+    :class:`amostra.mongo_client.Client` stores them, so the two clients can
+    be used on the same database.
+    """
+
+    def __init__(self, database, *, revision_storage='full',
+                 snapshot_interval=10):
+        """
+        Connect to a MongoDB datbase.
+
+        Parameters
+        ----------
+        database: pymongo.asynchronous.database.AsyncDatabase or URI string
+        revision_storage: {'full', 'delta'}, optional
+            How previous versions of documents are stored
+        snapshot_interval: int, optional
+            With ``revision_storage='delta'``, store a full copy of every
+            revision that is a multiple of this number.
+        """
+        if database is None:
+            raise ValueError("Database should be URI or pymongo-like object.")
+        if revision_storage not in ('full', 'delta'):
+            raise ValueError(f"revision_storage must be 'full' or 'delta', "
+                             f"not {revision_storage!r}")
+        if snapshot_interval < 1:
+            raise ValueError("snapshot_interval must be a positive integer.")
+        if isinstance(database, str):
+            database = _get_database(database)
+        self._db = database
+        self._revision_storage = revision_storage
+        self._snapshot_interval = snapshot_interval
+        self._samples = AsyncCollectionAccessor(self, Sample)
+        self._containers = AsyncCollectionAccessor(self, Container)
+
+    @property
+    def samples(self):
+        """
+        Accessor for creating and searching Samples
+        """
+        return self._samples
+
+    @property
+    def containers(self):
+        """
+        Accessor for creating and searching Containers
+        """
+        return self._containers
+
+    def _make_document(self, obj_type, parameters):
+        """
+        Validate new JSON-safe parameters and fill in defaults and a uuid.
+        """
+        obj = obj_type(self, **{name: obj_type._from_json(self, name, value)
+                                for name, value in parameters.items()})
+        return obj.to_dict()
+
+    async def _update(self, obj_type, uuid, changes):
+        """
+        Apply JSON-safe changes to a document as one new revision.
+        """
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        collection = self._db[collection_name]
+        revisions = self._db[f'{collection_name}_revisions']
+        while True:
+            original = await collection.find_one({'uuid': uuid})
+            if original is None:
+                return None
+            original.pop('_id')  # Remove the internal MongoDB id.
+            obj_type._validator.validate({**original, **changes})
+            # Update only if no one else has changed the document since we
+            # read it, so that original is the revision being replaced.
+            result = await collection.update_one(
+                {'uuid': uuid, 'revision': original['revision']},
+                {'$set': changes, '$inc': {'revision': 1}})
+            if result.matched_count:
+                break
+        # TODO Use transactions for this once we have MongoDB 4.0+.
+        # Insert the old version in {collection_name}_revisions
+        await revisions.insert_one(_revision_document(
+            original, changes, self._is_snapshot(original['revision'])))
+        return original['revision'] + 1
+
+    def _is_snapshot(self, revision):
+        """
+        Whether the given revision is stored in full in _revisions.
+        """
+        return (self._revision_storage == 'full' or
+                revision % self._snapshot_interval == 0)
+
+    async def _find_revision(self, obj_type, uuid, num):
+        """
+        Return the raw document for one revision, or None if not found.
+        """
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        revisions = self._db[f'{collection_name}_revisions']
+        document = await revisions.find_one({'uuid': uuid, 'revision': num})
+        if document is None or '_delta' not in document:
+            return document
+        # Reconstruct it, starting from the closest later full copy.
+        later = {'uuid': uuid, 'revision': {'$gt': num}}
+        start = await revisions.find_one(
+            {**later, '_delta': {'$exists': False}},
+            sort=[('revision', pymongo.ASCENDING)])
+        if start is None:
+            start = await self._db[collection_name].find_one({'uuid': uuid})
+        cursor = (revisions.find({'uuid': uuid,
+                                  'revision': {'$gte': num,
+                                               '$lt': start['revision']}})
+                           .sort('revision', pymongo.DESCENDING))
+        document = start
+        async for revision in cursor:
+            document = _reconstruct(document, revision)
+        return document
+
+
+class AsyncCollectionAccessor:
+    """
+    Accessor used on AsyncClients
+    """
+    def __init__(self, client, obj_type):
+        self._client = client
+        self._obj_type = obj_type
+        self._collection = client._db[TYPES_TO_COLLECTION_NAMES[self._obj_type]]
+
+    async def new(self, **parameters):
+        """
+        Create a document.
+
+        Parameters
+        ----------
+        **parameters
+            JSON-safe values of the fields
+
+        Returns
+        -------
+        record: Record
+        """
+        document = self._client._make_document(self._obj_type, parameters)
+        await self._collection.insert_one(document)
+        return self._to_record(document)
+
+    async def new_many(self, documents, *, ordered=True, chunk_size=1000):
+        """
+        Create many documents, validating all of them before inserting any.
+
+        Parameters
+        ----------
+        documents: iterable of dicts
+            JSON-safe values of the fields of each new document
+        ordered: bool, optional
+            If True (default), stop inserting at the first error. If False,
+            attempt to insert all documents, which may be faster.
+        chunk_size: int, optional
+            Maximum number of documents inserted in one operation
+
+        Returns
+        -------
+        records: list
+        """
+        documents = [self._client._make_document(self._obj_type, parameters)
+                     for parameters in documents]
+        for i in range(0, len(documents), chunk_size):
+            await self._collection.insert_many(documents[i:i + chunk_size],
+                                               ordered=ordered)
+        return [self._to_record(document) for document in documents]
+
+    async def update(self, uuid, changes):
+        """
+        Change some fields of a document, as one new revision.
+
+        Parameters
+        ----------
+        uuid: string
+        changes: dict
+            Maps field names to new JSON-safe values
+
+        Returns
+        -------
+        revision: int or None
+            The new revision number, or None if there is no such document
+        """
+        _check_changes(self._obj_type, changes)
+        return await self._client._update(self._obj_type, uuid, changes)
+
+    async def find(self, filter=None, fields=None, *,
+                   sort=None, limit=None, skip=None):
+        """
+        Search for documents.
+
+        This is an asynchronous generator of read-only records.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        fields: list, optional
+            If given, fetch only these fields (plus uuid and revision).
+        sort: string or list, optional
+            A field name to sort by in ascending order, or a list of
+            ``(field, direction)`` pairs where direction is 1 (ascending) or
+            -1 (descending)
+        limit: int, optional
+            Maximum number of results
+        skip: int, optional
+            Number of results to skip
+        """
+        projection = None
+        if fields is not None:
+            projection = {'_id': False, 'uuid': True, 'revision': True,
+                          **{field: True for field in fields}}
+        cursor = self._collection.find(filter or {}, projection,
+                                       sort=normalize_sort(sort),
+                                       limit=limit or 0, skip=skip or 0)
+        async for document in cursor:
+            yield self._to_record(document)
+
+    async def find_one(self, filter):
+        document = await self._collection.find_one(filter)
+        if document is None:
+            return None
+        return self._to_record(document)
+
+    async def revisions(self, uuid, *, before=None, limit=None):
+        """
+        Access revisions of a document with the most recent first.
+
+        This is an asynchronous generator of read-only records.
+
+        Parameters
+        ----------
+        uuid: string
+        before: int, optional
+            Start with the revision just before this revision number.
+        limit: int, optional
+            Maximum number of revisions
+        """
+        revisions = self._client._db[f'{self._collection.name}_revisions']
+        query = {'uuid': uuid}
+        if before is not None:
+            query['revision'] = {'$lt': before}
+        cursor = revisions.find(query).sort('revision', pymongo.DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        document = None
+        async for revision in cursor:
+            if '_delta' in revision and document is None:
+                # Start from the document that follows this revision.
+                if before is not None:
+                    document = await self._client._find_revision(
+                        self._obj_type, uuid, before)
+                if document is None:
+                    document = await self._collection.find_one({'uuid': uuid})
+            document = _reconstruct(document, revision)
+            yield self._to_record(document)
+
+    async def count(self, filter=None, *, estimated=False):
+        """
+        Count documents without fetching them.
+
+        Parameters
+        ----------
+        filter: dict, optional
+            MongoDB query
+        estimated: bool, optional
+            If True, return a fast estimate of the total number of documents
+            from the collection metadata. This cannot be combined with a
+            filter.
+
+        Returns
+        -------
+        count: int
+        """
+        if estimated:
+            if filter:
+                raise ValueError("An estimated count cannot take a filter.")
+            return await self._collection.estimated_document_count()
+        return await self._collection.count_documents(filter or {})
+
+    async def distinct(self, field, filter=None):
+        """
+        List the distinct values of a field.
+
+        For a list-valued field, such as ``tags``, this lists the distinct
+        items.
+
+        Parameters
+        ----------
+        field: string
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        values: list
+        """
+        return await self._collection.distinct(field, filter)
+
+    async def facets(self, fields, filter=None):
+        """
+        Count the documents having each value of some fields.
+
+        For a list-valued field, such as ``tags``, this counts each item.
+
+        Parameters
+        ----------
+        fields: list
+            Field names
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        facets: dict
+            Maps each field to a dict of ``{value: count}``, most common
+            value first
+        """
+        fields = list(fields)
+        cursor = await self._collection.aggregate(
+            _facets_pipeline(fields, filter))
+        result, = await cursor.to_list(None)
+        return _facets_result(fields, result)
+
+    def _to_record(self, document):
+        document.pop('_id', None)  # Remove the internal MongoDB id.
+        return self._obj_type._record_type(self._client, document)
+
+
+def _get_database(uri):
+    client = AsyncMongoClient(uri)
+    try:
+        # Called with no args, get_database() returns the database
+        # specified in the client's uri --- or raises if there was none.
+        return client.get_database()
+    except pymongo.errors.ConfigurationError as err:
+        raise ValueError(
+            f"Invalid client: {client} "
+            f"Did you forget to include a database?") from err
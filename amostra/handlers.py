@@ -1,64 +1,537 @@
+import base64
+import binascii
+import functools
+import itertools
+import json
+
 from jsonschema.exceptions import ValidationError
-from tornado import web
-from tornado.escape import json_decode
+from tornado import ioloop, web
+from tornado.escape import json_decode, json_encode
+
+from .utils import normalize_sort
+
+# Number of search results per response, unless the client asks otherwise
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Number of documents written between flushes when streaming
+FLUSH_INTERVAL = 100
+NDJSON = 'application/x-ndjson'
+# Types of the sort key values that keyset pagination can resume from
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+async def _blocking(handler, func, *args, **kwargs):
+    """
+    Run blocking database work on the application's executor, if it has one.
+
+    This keeps the IOLoop free to accept and serve other requests meanwhile.
+    """
+    executor = handler.settings.get('executor')
+    if executor is None:
+        return func(*args, **kwargs)
+    return await ioloop.IOLoop.current().run_in_executor(
+        executor, functools.partial(func, *args, **kwargs))
 
 
 class CreateHandler(web.RequestHandler):
-    def post(self, collection_name):
+    async def post(self, collection_name):
         parameters = json_decode(self.request.body)['parameters']
-        accessor = getattr(self.settings['mongo_client'], collection_name)
+        client = self.settings['mongo_client']
+        accessor = getattr(client, collection_name)
         parameters.pop('uuid')
         parameters.pop('revision')
+        parameters = {name: accessor._obj_type._from_json(client, name, value)
+                      for name, value in parameters.items()}
         try:
-            obj = accessor.new(**parameters)
+            obj = await _blocking(self, accessor.new, **parameters)
         except ValidationError:
-            self.write_error(403)
+            self.send_error(403)
+            return
         self.write({'uuid': obj.uuid})
 
 
+class BulkCreateHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        body = json_decode(self.request.body)
+        client = self.settings['mongo_client']
+        accessor = getattr(client, collection_name)
+        documents = []
+        for parameters in body['parameters']:
+            parameters.pop('uuid')
+            parameters.pop('revision')
+            documents.append(
+                {name: accessor._obj_type._from_json(client, name, value)
+                 for name, value in parameters.items()})
+        try:
+            objs = await _blocking(self, accessor.new_many, documents,
+                                   ordered=body.get('ordered', True))
+        except ValidationError:
+            self.send_error(403)
+            return
+        self.write({'uuids': [obj.uuid for obj in objs]})
+
+
+def _wants_ndjson(handler):
+    return NDJSON in handler.request.headers.get('Accept', '')
+
+
+async def _write_ndjson(handler, documents):
+    """
+    Write documents as newline-delimited JSON, flushing as we go.
+
+    The first documents reach the client while the rest are still being read
+    from the database, and the response is never held in memory all at once.
+    """
+    handler.set_header('Content-Type', NDJSON)
+    async for batch in _batches(handler, documents):
+        for document in batch:
+            handler.write(json_encode(document) + '\n')
+        await handler.flush()
+
+
+async def _batches(handler, documents):
+    """
+    Read an iterable or asynchronous iterable in lists of FLUSH_INTERVAL.
+
+    A blocking iterable is read on the application's executor.
+    """
+    if hasattr(documents, '__aiter__'):
+        batch = []
+        async for document in documents:
+            batch.append(document)
+            if len(batch) == FLUSH_INTERVAL:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+    documents = iter(documents)
+    while True:
+        batch = await _blocking(
+            handler, list, itertools.islice(documents, FLUSH_INTERVAL))
+        if not batch:
+            return
+        yield batch
+
+
 class SearchHandler(web.RequestHandler):
-    def post(self, collection_name):
-        filter = json_decode(self.request.body)['filter']
+    async def post(self, collection_name):
+        """
+        Return one page of search results.
+
+        The response includes an opaque ``continuation`` token if there are
+        more results. Send it back, with the same query, to get the next
+        page. Pages resume from the last result of the previous page (keyset
+        pagination), so each page costs an index lookup, not a skip.
+
+        If the request accepts application/x-ndjson, stream all the results
+        instead, one document per line.
+        """
+        body = json_decode(self.request.body)
         accessor = getattr(self.settings['mongo_client'], collection_name)
-        # TODO Add pagination.
-        results = list(accessor.find(filter))
-        self.write({"results": [result.to_dict() for result in results]})
+        if _wants_ndjson(self):
+            records = accessor.find(body['filter'], readonly=True,
+                                    fields=body.get('fields'),
+                                    sort=body.get('sort'),
+                                    limit=body.get('limit'),
+                                    skip=body.get('skip'))
+            await _write_ndjson(self, (record.to_dict() for record in records))
+            return
+        query, page_size = _page_query(body)
+
+        def search():
+            return [record.to_dict()
+                    for record in accessor.find(readonly=True, **query)]
+
+        self.write(_page(query['sort'], page_size,
+                         await _blocking(self, search), body.get('fields')))
+
+
+def _page_query(body):
+    """
+    Make the find() arguments for one page of search results.
+
+    Returns
+    -------
+    query: dict
+        Keyword arguments for find(). One more result than the page size is
+        requested, to learn whether there is another page.
+    page_size: int
+    """
+    filter = body['filter']
+    fields = body.get('fields')
+    limit = body.get('limit')
+    skip = body.get('skip')
+    page_size = min(body.get('page_size') or DEFAULT_PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+    if limit:
+        page_size = min(page_size, limit)
+    # Break ties by uuid so that the order is total and each page can
+    # resume exactly where the previous one ended.
+    keys = normalize_sort(body.get('sort')) or []
+    if 'uuid' not in dict(keys):
+        keys.append(('uuid', 1))
+    if body.get('continuation') is not None:
+        after = _decode_continuation(body['continuation'], len(keys))
+        filter = {'$and': [filter, _keyset_filter(keys, after)]}
+        # The skip was applied on the first page.
+        skip = None
+    if fields is not None:
+        # The sort keys are needed to make the continuation token.
+        fields = list(fields) + [field for field, _ in keys
+                                 if field not in fields]
+    query = {'filter': filter, 'fields': fields, 'sort': keys,
+             'limit': page_size + 1, 'skip': skip}
+    return query, page_size
+
+
+def _page(keys, page_size, results, fields=None):
+    """
+    Make the response for one page, given the results of _page_query.
+
+    If fields were requested, the sort keys that _page_query added to them
+    are removed from the results once the continuation token is made.
+    """
+    continuation = None
+    if len(results) > page_size:
+        for result in results:
+            for field, _ in keys:
+                if not isinstance(_get_field(result, field), SCALAR_TYPES):
+                    # Lists sort by their smallest or largest item, and
+                    # documents field by field, neither of which a keyset
+                    # query can resume from. A single page is fine.
+                    raise web.HTTPError(
+                        400, f"Cannot page through results sorted by "
+                             f"{field}, which is not a single value")
+        results = results[:page_size]
+        continuation = _encode_continuation(
+            [_get_field(results[-1], field) for field, _ in keys])
+    if fields is not None:
+        requested = {field.split('.')[0] for field in fields}
+        requested.update(('uuid', 'revision'))
+        results = [{name: value for name, value in result.items()
+                    if name in requested}
+                   for result in results]
+    return {"results": results, "continuation": continuation}
+
+
+def _int_argument(handler, name):
+    value = handler.get_argument(name, None)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPError(400, f"{name} must be an integer")
+
+
+def _get_field(document, field):
+    "Get a possibly dotted field from a document, or None if missing."
+    for name in field.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(name)
+    return document
+
+
+def _keyset_filter(keys, values):
+    """
+    Make a query for the documents that sort after the given values.
+
+    Parameters
+    ----------
+    keys: list
+        (field, direction) pairs, ending with a unique field
+    values: list
+        The values of those fields in the last document of the previous page
+
+    Missing and null values sort before all others, and comparison operators
+    only match values of the same type, so None is handled explicitly.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(keys):
+        clause = {previous: value
+                  for (previous, _), value in zip(keys[:i], values[:i])}
+        value = values[i]
+        if value is None:
+            if direction < 0:
+                # Nothing sorts after null in descending order.
+                continue
+            clause[field] = {'$ne': None}
+        elif direction > 0:
+            clause[field] = {'$gt': value}
+        else:
+            clause['$or'] = [{field: {'$lt': value}}, {field: None}]
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def _encode_continuation(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_continuation(token, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise web.HTTPError(400, "Invalid continuation token")
+    if (not isinstance(values, list) or len(values) != length or
+            not all(isinstance(value, SCALAR_TYPES) for value in values)):
+        raise web.HTTPError(400, "Invalid continuation token")
+    return values
+
+
+class CountHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        body = json_decode(self.request.body)
+        accessor = getattr(self.settings['mongo_client'], collection_name)
+        try:
+            count = await _blocking(self, accessor.count, body.get('filter'),
+                                    estimated=body.get('estimated', False))
+        except ValueError:
+            self.send_error(400)
+            return
+        self.write({'count': count})
+
+
+class DistinctHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        body = json_decode(self.request.body)
+        accessor = getattr(self.settings['mongo_client'], collection_name)
+        values = await _cached(self, ('distinct', collection_name, body),
+                               lambda: accessor.distinct(body['field'],
+                                                         body.get('filter')))
+        self.write({'values': values})
+
+
+class FacetsHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        body = json_decode(self.request.body)
+        accessor = getattr(self.settings['mongo_client'], collection_name)
+        facets = await _cached(self, ('facets', collection_name, body),
+                               lambda: accessor.facets(body['fields'],
+                                                       body.get('filter')))
+        self.write({'facets': facets})
+
+
+async def _cached(handler, key, compute):
+    """
+    Use the server's aggregation cache, if it has one.
+    """
+    cache = handler.settings.get('aggregation_cache')
+    if cache is None:
+        return await _blocking(handler, compute)
+    return await _blocking(handler, cache.get,
+                           json.dumps(key, sort_keys=True), compute)
 
 
 class ObjectHandler(web.RequestHandler):
-    def get(self, collection_name, uuid):
+    async def get(self, collection_name, uuid):
         accessor = getattr(self.settings['mongo_client'], collection_name)
-        result = accessor.find_one({'uuid': uuid})
+        result = await _blocking(self, accessor.find_one, {'uuid': uuid})
+        if result is None:
+            self.send_error(404)
+            return
         self.write(result.to_dict())
 
-    def put(self, collection_name, uuid):
-        change = json_decode(self.request.body)['change']
+    async def put(self, collection_name, uuid):
+        body = json_decode(self.request.body)
+        if 'changes' in body:
+            # {name: new_value, ...}, synced as one revision
+            changes = body['changes']
+        else:
+            change = body['change']
+            changes = {change['name']: change['new']}
         accessor = getattr(self.settings['mongo_client'], collection_name)
-        change['owner'] = accessor.find_one({'uuid': uuid})
+        # Update the stored document rather than a live object, which
+        # requests running on other threads may share.
         try:
-            setattr(change['owner'], change['name'], change['new'])
+            revision = await _blocking(self, accessor.update, uuid, changes)
         except ValidationError:
-            self.write_error(403)
-        self.finish()
+            self.send_error(403)
+            return
+        except ValueError:
+            self.send_error(400)
+            return
+        if revision is None:
+            self.send_error(404)
+            return
+        self.write({'revision': revision})
 
 
 class RevisionsHandler(web.RequestHandler):
-    def get(self, collection_name, uuid):
-        accessor = getattr(self.settings['mongo_client'], collection_name)
-        result = accessor.find_one({'uuid': uuid})
-        # TODO Add pagination.
-        revisions = result.revisions()
-        self.write({"revisions": [revision.to_dict() for revision in revisions]})
+    async def get(self, collection_name, uuid):
+        """
+        Return revisions with the most recent first.
+
+        Use ``?limit=N`` to get at most N revisions and ``?before=<revision>``
+        to continue from the last revision of the previous page.
+        """
+        before = _int_argument(self, 'before')
+        limit = _int_argument(self, 'limit')
+        client = self.settings['mongo_client']
+        accessor = getattr(client, collection_name)
+        result = await _blocking(self, accessor.find_one, {'uuid': uuid})
+        revisions = (revision.to_dict() for revision in
+                     client._revisions(result, before=before, limit=limit))
+        if _wants_ndjson(self):
+            await _write_ndjson(self, revisions)
+            return
+        self.write({"revisions": await _blocking(self, list, revisions)})
+
+
+class RevertHandler(web.RequestHandler):
+    async def post(self, collection_name, uuid):
+        revision = json_decode(self.request.body)['revision']
+        client = self.settings['mongo_client']
+        accessor = getattr(client, collection_name)
+        try:
+            document = await _blocking(self, client._revert_document,
+                                       accessor._obj_type, uuid, revision)
+        except ValueError:
+            self.send_error(404)
+            return
+        self.write(document)
+
+
+class MetricsHandler(web.RequestHandler):
+    def get(self):
+        """
+        Report how busy the server is.
+
+        The executor's queue depth is the number of requests waiting for a
+        thread to run their database work. If it is often above zero, or the
+        wait time grows faster than the run time, the pool is saturated.
+        """
+        executor = self.settings.get('executor')
+        self.write({'executor': None if executor is None
+                    else executor.metrics()})
+
+
+class AsyncCreateHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        parameters = json_decode(self.request.body)['parameters']
+        accessor = getattr(self.settings['async_mongo_client'],
+                           collection_name)
+        parameters.pop('uuid')
+        parameters.pop('revision')
+        try:
+            record = await accessor.new(**parameters)
+        except ValidationError:
+            self.send_error(403)
+            return
+        self.write({'uuid': record.uuid})
+
+
+class AsyncSearchHandler(web.RequestHandler):
+    async def post(self, collection_name):
+        "Like SearchHandler, without blocking the IOLoop."
+        body = json_decode(self.request.body)
+        accessor = getattr(self.settings['async_mongo_client'],
+                           collection_name)
+        if _wants_ndjson(self):
+            records = accessor.find(body['filter'], fields=body.get('fields'),
+                                    sort=body.get('sort'),
+                                    limit=body.get('limit'),
+                                    skip=body.get('skip'))
+            await _write_ndjson(
+                self, (record.to_dict() async for record in records))
+            return
+        query, page_size = _page_query(body)
+        self.write(_page(query['sort'], page_size,
+                         [record.to_dict() async for record in
+                          accessor.find(**query)],
+                         body.get('fields')))
+
+
+class AsyncObjectHandler(web.RequestHandler):
+    async def get(self, collection_name, uuid):
+        accessor = getattr(self.settings['async_mongo_client'],
+                           collection_name)
+        result = await accessor.find_one({'uuid': uuid})
+        if result is None:
+            self.send_error(404)
+            return
+        self.write(result.to_dict())
+
+    async def put(self, collection_name, uuid):
+        body = json_decode(self.request.body)
+        if 'changes' in body:
+            # {name: new_value, ...}, applied as one revision
+            changes = body['changes']
+        else:
+            change = body['change']
+            changes = {change['name']: change['new']}
+        accessor = getattr(self.settings['async_mongo_client'],
+                           collection_name)
+        try:
+            revision = await accessor.update(uuid, changes)
+        except ValidationError:
+            self.send_error(403)
+            return
+        except ValueError:
+            self.send_error(400)
+            return
+        if revision is None:
+            self.send_error(404)
+            return
+        self.write({'revision': revision})
+
+
+class AsyncRevisionsHandler(web.RequestHandler):
+    async def get(self, collection_name, uuid):
+        "Like RevisionsHandler, without blocking the IOLoop."
+        before = _int_argument(self, 'before')
+        limit = _int_argument(self, 'limit')
+        accessor = getattr(self.settings['async_mongo_client'],
+                           collection_name)
+        revisions = (revision.to_dict() async for revision in
+                     accessor.revisions(uuid, before=before, limit=limit))
+        if _wants_ndjson(self):
+            await _write_ndjson(self, revisions)
+            return
+        self.write({"revisions": [revision async for revision in revisions]})
+
 
+def init_handlers(asynchronous=False):
+    """
+    Make the routes for the application.
 
-def init_handlers():
+    Parameters
+    ----------
+    asynchronous: bool, optional
+        If True, create, search, get, update and list revisions with the
+        AsyncClient in the application setting 'async_mongo_client', without
+        blocking the IOLoop. The other routes still use 'mongo_client'.
+    """
+    # GET /metrics
     # POST /samples/new
+    # POST /samples/bulk
+    # POST /samples/count
+    # POST /samples/distinct
+    # POST /samples/facets
     # POST /samples
     # GET /samples/<uuid>
     # PUT /samples/<uuid>
-    return [(r'/([A-Za-z0-9_\.\-]+)/new/?', CreateHandler),
-            (r'/([A-Za-z0-9_\.\-]+)/([A-Za-z0-9_\.\-]+)/?', ObjectHandler),
+    # GET /samples/<uuid>/revisions
+    # POST /samples/<uuid>/revert
+    if asynchronous:
+        create, search, object_, revisions = (
+            AsyncCreateHandler, AsyncSearchHandler, AsyncObjectHandler,
+            AsyncRevisionsHandler)
+    else:
+        create, search, object_, revisions = (
+            CreateHandler, SearchHandler, ObjectHandler, RevisionsHandler)
+    return [(r'/metrics/?', MetricsHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/new/?', create),
+            (r'/([A-Za-z0-9_\.\-]+)/bulk/?', BulkCreateHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/count/?', CountHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/distinct/?', DistinctHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/facets/?', FacetsHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/([A-Za-z0-9_\.\-]+)/?', object_),
             (r'/([A-Za-z0-9_\.\-]+)/([A-Za-z0-9_\.\-]+)/revisions/?',
-             RevisionsHandler),
-            (r'/([A-Za-z0-9_\.\-]+)/?', SearchHandler),
+             revisions),
+            (r'/([A-Za-z0-9_\.\-]+)/([A-Za-z0-9_\.\-]+)/revert/?',
+             RevertHandler),
+            (r'/([A-Za-z0-9_\.\-]+)/?', search),
             ]
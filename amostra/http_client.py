@@ -1,8 +1,17 @@
+import itertools
+import json
+import weakref
+
 import requests
 
 from .objects import TYPES_TO_COLLECTION_NAMES, Container, Sample
 from .utils import url_path_join
 
+# Number of streamed documents to hydrate at a time, and of revisions to
+# request at a time
+PAGE_SIZE = 100
+NDJSON = 'application/x-ndjson'
+
 
 class Client:
     """
@@ -14,16 +23,23 @@ class Client:
     database.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, *, page_size=None):
         """
         Connect to an amostra HTTP server.
 
         Parameters
         ----------
         url: string
+        page_size: int, optional
+            Number of search results to request at a time. By default, the
+            server decides.
         """
         self._session = requests.Session()
         self._url = url
+        self._page_size = page_size
+        # Maps (object type, uuid) to the live object, if there is one, so that
+        # loading the same document again does not make another copy.
+        self._identity_map = weakref.WeakValueDictionary()
         self._samples = CollectionAccessor(self, Sample)
         self._containers = CollectionAccessor(self, Container)
 
@@ -68,8 +84,38 @@ class Client:
         # Observe any updates to the object and sync them to MongoDB.
         obj.observe(self._update)
 
+        self._identity_map[(obj_type, obj.uuid)] = obj
         return obj
 
+    def _new_documents(self, obj_type, documents, ordered, chunk_size):
+        """
+        Insert many new documents, each with a new uuid.
+        """
+        # Make and validate all the new objects before inserting any.
+        objs = [obj_type(self, **document) for document in documents]
+
+        # Find the assocaited MongoDB collection.
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+
+        # Insert the new objects, one request per chunk.
+        for i in range(0, len(objs), chunk_size):
+            chunk = objs[i:i + chunk_size]
+            response = self._session.post(
+                self._make_url(collection_name, 'bulk'),
+                json={'parameters': [obj.to_dict() for obj in chunk],
+                      'ordered': ordered})
+            response.raise_for_status()
+
+            # Let the server set the uuids.
+            for obj, uuid in zip(chunk, response.json()['uuids']):
+                obj.set_trait('uuid', uuid)
+                obj.set_trait('revision', 0)  # paranoia
+
+                # Observe any updates to the object and sync them to MongoDB.
+                obj.observe(self._update)
+                self._identity_map[(obj_type, obj.uuid)] = obj
+        return objs
+
     def _update(self, change):
         """
         Sync a change to an object, observed via traitlets, to MongoDB.
@@ -79,25 +125,77 @@ class Client:
         # Short-circuit here to avoid an infinite recursion.
         if change['name'] == 'revision':
             return
-        change = change.copy()
-        owner = change.pop('owner')  # pop because it is not serializable
+        owner = change['owner']
+        if owner._pending_changes is not None:
+            # A transaction is open. Record the original value and sync when
+            # the transaction is closed.
+            owner._pending_changes.setdefault(change['name'], change['old'])
+            return
+        self._sync_changes(owner, [change['name']])
+
+    def _sync_changes(self, owner, names):
+        """
+        Sync the current values of some traits to the server in one request.
+        """
         collection_name = TYPES_TO_COLLECTION_NAMES[type(owner)]
+        # We need the JSON-safe values of the changes.
+        new = owner.to_dict()
         response = self._session.put(
             self._make_url(collection_name, owner.uuid),
-            json={'change': change})
+            json={'changes': {name: new[name] for name in names}})
         response.raise_for_status()
+        revision = response.json()['revision']
+        if revision != owner.revision + 1:
+            # Someone else changed the document since we loaded it. Catch up
+            # with their changes to the other fields.
+            response = self._session.get(
+                self._make_url(collection_name, owner.uuid))
+            response.raise_for_status()
+            document = response.json()
+            owner._refresh(document)
+            revision = document['revision']
+        owner.set_trait('revision', revision)
+
+    def _revert(self, obj, num):
+        """
+        Restore an earlier revision of an object as one new revision.
+        """
+        type_ = type(obj)
+        collection_name = TYPES_TO_COLLECTION_NAMES[type_]
+        response = self._session.post(
+            self._make_url(collection_name, obj.uuid, 'revert'),
+            json={'revision': num})
+        if response.status_code == 404:
+            raise ValueError(f'revision {num} you were '
+                             f'trying to revert to was not found')
+        response.raise_for_status()
+        # The server has already persisted the new revision.
+        document = response.json()
+        obj._refresh(document)
+        obj.set_trait('revision', document['revision'])
 
     def _revisions(self, obj):
         """
         Access all revisions to an object with the most recent first.
+
+        Revisions are fetched one page at a time, as they are consumed.
         """
         type_ = type(obj)
         collection_name = TYPES_TO_COLLECTION_NAMES[type_]
-        response = self._session.get(
-            self._make_url(collection_name, obj.uuid, 'revisions'))
-        response.raise_for_status()
-        for document in response.json()['revisions']:
-            yield self._document_to_obj(type_, document)
+        params = {'limit': PAGE_SIZE}
+        while True:
+            response = self._session.get(
+                self._make_url(collection_name, obj.uuid, 'revisions'),
+                params=params)
+            response.raise_for_status()
+            documents = response.json()['revisions']
+            if not documents:
+                return
+            # Note where to continue before from_documents consumes them.
+            params['before'] = documents[-1]['revision']
+            yield from type_.from_documents(self, documents)
+            if len(documents) < PAGE_SIZE:
+                return
 
 
 class CollectionAccessor:
@@ -112,19 +210,211 @@ class CollectionAccessor:
     def new(self, *args, **kwargs):
         return self._client._new_document(self._obj_type, args, kwargs)
 
-    def find(self, filter=None):
+    def new_many(self, documents, *, ordered=True, chunk_size=1000):
+        """
+        Create many documents, validating all of them before inserting any.
+
+        Parameters
+        ----------
+        documents: iterable of dicts
+            Traits for each new object, as would be passed to ``new``
+        ordered: bool, optional
+            If True (default), stop inserting at the first error. If False,
+            attempt to insert all documents, which may be faster.
+        chunk_size: int, optional
+            Maximum number of documents sent in one request
+
+        Returns
+        -------
+        objs: list
+        """
+        return self._client._new_documents(self._obj_type, documents,
+                                           ordered, chunk_size)
+
+    def find(self, filter=None, readonly=False, fields=None, *,
+             sort=None, limit=None, skip=None, stream=False):
+        """
+        Search for documents.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        readonly: bool, optional
+            If True, yield lightweight read-only records instead of live
+            objects. Use ``record.promote()`` to get a live object.
+        fields: list, optional
+            If given, fetch only these fields (plus uuid and revision) and
+            yield partial read-only records.
+        sort: string or list, optional
+            A field name to sort by in ascending order, or a list of
+            ``(field, direction)`` pairs where direction is 1 (ascending) or
+            -1 (descending)
+        limit: int, optional
+            Maximum number of results
+        skip: int, optional
+            Number of results to skip
+        stream: bool, optional
+            If True, receive all the results in one streamed response instead
+            of page by page. This suits exporting large result sets.
+        """
         if filter is None:
             filter = {}
+        body = {'filter': filter, 'sort': sort, 'skip': skip,
+                'page_size': self._client._page_size}
+        if fields is not None:
+            readonly = True
+            body['fields'] = list(fields)
+        if stream:
+            body['limit'] = limit
+            with self._client._session.post(
+                    self._client._make_url(self._collection_name),
+                    json=body, headers={'Accept': NDJSON},
+                    stream=True) as response:
+                response.raise_for_status()
+                for page in _ndjson_pages(response):
+                    yield from self._to_objs(page, readonly)
+            return
+        # Fetch one page at a time, as the results are consumed.
+        remaining = limit
+        while True:
+            body['limit'] = remaining
+            response = self._client._session.post(
+                self._client._make_url(self._collection_name),
+                json=body)
+            response.raise_for_status()
+            data = response.json()
+            yield from self._to_objs(data['results'], readonly)
+            if remaining is not None:
+                remaining -= len(data['results'])
+                if remaining <= 0:
+                    return
+            if data.get('continuation') is None:
+                return
+            body['continuation'] = data['continuation']
+
+    def find_one(self, filter, readonly=False, fields=None):
+        """
+        Find the first matching document, or None.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        readonly: bool, optional
+            If True, return a lightweight read-only record instead of a live
+            object.
+        fields: list, optional
+            If given, fetch only these fields (plus uuid and revision) and
+            return a partial read-only record.
+        """
+        filter = filter or {}
+        if (fields is not None or set(filter) != {'uuid'} or
+                not isinstance(filter['uuid'], str)):
+            # Looking up a uuid directly gives the whole document, so search.
+            return next(self.find(filter, readonly, fields, limit=1), None)
+        # Look it up directly instead of searching.
+        response = self._client._session.get(
+            self._client._make_url(self._collection_name, filter['uuid']))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        obj, = self._to_objs([response.json()], readonly)
+        return obj
+
+    def count(self, filter=None, *, estimated=False):
+        """
+        Count documents without fetching them.
+
+        Parameters
+        ----------
+        filter: dict, optional
+            MongoDB query
+        estimated: bool, optional
+            If True, return a fast estimate of the total number of documents
+            from the collection metadata. This cannot be combined with a
+            filter.
+
+        Returns
+        -------
+        count: int
+        """
+        if estimated and filter:
+            raise ValueError("An estimated count cannot take a filter.")
         response = self._client._session.post(
-            self._client._make_url(self._collection_name),
-            json={'filter': filter})
+            self._client._make_url(self._collection_name, 'count'),
+            json={'filter': filter or {}, 'estimated': estimated})
         response.raise_for_status()
-        for document in response.json()['results']:
-            yield self._obj_type.from_document(self._client, document)
-
-    def find_one(self, filter):
-        # TODO Improve the performance once pagination support is added.
-        try:
-            return next(self.find(filter))
-        except StopIteration:
-            return None
+        return response.json()['count']
+
+    def distinct(self, field, filter=None):
+        """
+        List the distinct values of a field.
+
+        For a list-valued field, such as ``tags``, this lists the distinct
+        items.
+
+        Parameters
+        ----------
+        field: string
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        values: list
+        """
+        response = self._client._session.post(
+            self._client._make_url(self._collection_name, 'distinct'),
+            json={'field': field, 'filter': filter})
+        response.raise_for_status()
+        return response.json()['values']
+
+    def facets(self, fields, filter=None):
+        """
+        Count the documents having each value of some fields.
+
+        For a list-valued field, such as ``tags``, this counts each item.
+
+        Parameters
+        ----------
+        fields: list
+            Field names
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        facets: dict
+            Maps each field to a dict of ``{value: count}``, most common
+            value first
+
+        Examples
+        --------
+
+        >>> client.samples.facets(['tags', 'projects'])
+        {'tags': {'powder': 12, 'wet': 3}, 'projects': {'proj-1': 15}}
+        """
+        response = self._client._session.post(
+            self._client._make_url(self._collection_name, 'facets'),
+            json={'fields': list(fields), 'filter': filter})
+        response.raise_for_status()
+        return response.json()['facets']
+
+    def _to_objs(self, documents, readonly):
+        if readonly:
+            return [self._obj_type._record_type(self._client, document)
+                    for document in documents]
+        return self._obj_type.from_documents(self._client, documents)
+
+
+def _ndjson_pages(response, page_size=PAGE_SIZE):
+    """
+    Parse a streamed newline-delimited JSON response into lists of documents.
+    """
+    documents = (json.loads(line) for line in response.iter_lines() if line)
+    while True:
+        page = list(itertools.islice(documents, page_size))
+        if not page:
+            return
+        yield page
@@ -1,6 +1,24 @@
+import collections
+import copy
+import itertools
+import threading
+import weakref
+
 import pymongo
 
 from .objects import TYPES_TO_COLLECTION_NAMES, Container, Sample
+from .utils import normalize_sort
+
+# Number of search results converted to objects together
+PAGE_SIZE = 100
+# MongoDB's error code for a write that violates a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+# Secondary indexes created by Client.ensure_indexes, by collection name
+DEFAULT_INDEXES = {
+    'samples': ['name', 'tags', 'projects'],
+    'containers': ['name', 'kind'],
+}
 
 
 class Client:
@@ -14,21 +32,67 @@ class Client:
     Each collection has a counterpart named {collection_name}_revisions that
     stores previous version of the document. This approach was inspired by:
     https://www.mongodb.com/blog/post/building-with-patterns-the-document-versioning-pattern
+
+    By default each previous version is stored in full. With
+    ``revision_storage='delta'``, only the previous values of the fields that
+    changed are stored, plus a full snapshot every ``snapshot_interval``
+    revisions. Earlier versions are reconstructed transparently by
+    ``revisions()`` and ``revert()``. Both kinds of entries may coexist, so
+    the storage mode of an existing database can be changed at any time.
+
+    Optionally, documents looked up by uuid with ``find_one({'uuid': ...})``
+    are kept in a bounded LRU cache. The cache is updated by this client's own
+    writes. Changes made by others can be detected by checking the revision
+    of each cached document on access (``cache_validation=True``) or by
+    :meth:`watch_changes`.
     """
 
-    def __init__(self, database):
+    def __init__(self, database, *, revision_storage='full',
+                 snapshot_interval=10, cache_size=0, cache_validation=True,
+                 indexes=None):
         """
         Connect to a MongoDB datbase.
 
         Parameters
         ----------
         database: pymongo.Database or URI string
+        revision_storage: {'full', 'delta'}, optional
+            How previous versions of documents are stored
+        snapshot_interval: int, optional
+            With ``revision_storage='delta'``, store a full copy of every
+            revision that is a multiple of this number.
+        cache_size: int, optional
+            Maximum number of documents to cache. By default, nothing is
+            cached.
+        cache_validation: bool, optional
+            If True, check that a cached document is still the current
+            revision, with a query that returns only the revision number,
+            before using it.
+        indexes: dict, optional
+            Maps collection name to a list of secondary indexes, each given
+            as a field name or a list of (field, direction) pairs, to be
+            created by :meth:`ensure_indexes`. By default, DEFAULT_INDEXES.
         """
         if database is None:
             raise ValueError("Database should be URI or pymongo-like object.")
+        if revision_storage not in ('full', 'delta'):
+            raise ValueError(f"revision_storage must be 'full' or 'delta', "
+                             f"not {revision_storage!r}")
+        if snapshot_interval < 1:
+            raise ValueError("snapshot_interval must be a positive integer.")
         if isinstance(database, str):
             database = _get_database(database)
         self._db = database
+        self._revision_storage = revision_storage
+        self._snapshot_interval = snapshot_interval
+        self._cache = DocumentCache(cache_size) if cache_size else None
+        self._cache_validation = cache_validation
+        if indexes is None:
+            indexes = DEFAULT_INDEXES
+        self._indexes = indexes
+        # Maps (object type, uuid) to the live object, if there is one, so that
+        # loading the same document again does not make another copy.
+        self._identity_map = weakref.WeakValueDictionary()
         self._samples = CollectionAccessor(self, Sample)
         self._containers = CollectionAccessor(self, Container)
 
@@ -46,6 +110,75 @@ class Client:
         """
         return self._containers
 
+    def ensure_indexes(self):
+        """
+        Create the indexes that this client's queries rely on.
+
+        This creates a unique index on uuid for each collection, a unique
+        compound index on (uuid, revision) for each {collection}_revisions,
+        and the configured secondary indexes. Indexes that already exist are
+        left alone, so it is safe to call this every time.
+        """
+        for collection_name in TYPES_TO_COLLECTION_NAMES.values():
+            collection = self._db[collection_name]
+            collection.create_index('uuid', unique=True)
+            for keys in self._indexes.get(collection_name, []):
+                collection.create_index(keys)
+            revisions = self._db[f'{collection_name}_revisions']
+            revisions.create_index([('uuid', pymongo.ASCENDING),
+                                    ('revision', pymongo.DESCENDING)],
+                                   unique=True)
+
+    def cache_info(self):
+        """
+        Report cache statistics, or None if caching is not enabled.
+
+        Returns
+        -------
+        CacheInfo
+            namedtuple with hits, misses, evictions, maxsize, and currsize
+        """
+        if self._cache is None:
+            return None
+        return self._cache.info()
+
+    def watch_changes(self):
+        """
+        Invalidate cached documents when they are changed, by anyone.
+
+        This follows a MongoDB change stream, which requires a replica set,
+        in a background thread.
+
+        Returns
+        -------
+        change_stream: pymongo.change_stream.ChangeStream
+            Call its ``close()`` method to stop watching.
+        """
+        if self._cache is None:
+            raise RuntimeError("Caching is not enabled. Set cache_size.")
+        collection_names = list(TYPES_TO_COLLECTION_NAMES.values())
+        stream = self._db.watch(
+            [{'$match': {'ns.coll': {'$in': collection_names}}}],
+            full_document='updateLookup')
+
+        def invalidate():
+            try:
+                for change in stream:
+                    collection_name = change['ns']['coll']
+                    document = change.get('fullDocument')
+                    if document is None:
+                        # Deletions identify the document only by _id.
+                        self._cache.clear(collection_name)
+                    else:
+                        self._cache.invalidate(
+                            (collection_name, document['uuid']))
+            except pymongo.errors.PyMongoError:
+                # The stream was closed.
+                pass
+
+        threading.Thread(target=invalidate, daemon=True).start()
+        return stream
+
     def _new_document(self, obj_type, args, kwargs):
         """
         Insert a new document with a new uuid.
@@ -58,13 +191,46 @@ class Client:
         collection = self._db[collection_name]
 
         # Insert the new object.
-        collection.insert_one(obj.to_dict())
+        document = obj.to_dict()
+        collection.insert_one(document)
+        if self._cache is not None:
+            document.pop('_id')  # Remove the internal MongoDB id.
+            self._cache.put((collection_name, obj.uuid), document)
 
         # Observe any updates to the object and sync them to MongoDB.
         obj.observe(self._update)
 
+        self._identity_map[(obj_type, obj.uuid)] = obj
         return obj
 
+    def _new_documents(self, obj_type, documents, ordered, chunk_size):
+        """
+        Insert many new documents, each with a new uuid.
+        """
+        # Make and validate all the new objects before inserting any.
+        objs = [obj_type(self, **document) for document in documents]
+
+        # Find the assocaited MongoDB collection.
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        collection = self._db[collection_name]
+
+        # Insert the new objects, chunk_size at a time.
+        for i in range(0, len(objs), chunk_size):
+            chunk = objs[i:i + chunk_size]
+            documents = [obj.to_dict() for obj in chunk]
+            collection.insert_many(documents, ordered=ordered)
+            if self._cache is not None:
+                for document in documents:
+                    document.pop('_id')  # Remove the internal MongoDB id.
+                    self._cache.put((collection_name, document['uuid']),
+                                    document)
+
+        for obj in objs:
+            # Observe any updates to the object and sync them to MongoDB.
+            obj.observe(self._update)
+            self._identity_map[(obj_type, obj.uuid)] = obj
+        return objs
+
     def _update(self, change):
         """
         Sync a change to an object, observed via traitlets, to MongoDB.
@@ -75,24 +241,207 @@ class Client:
         if change['name'] == 'revision':
             return
         owner = change['owner']
+        if owner._pending_changes is not None:
+            # A transaction is open. Record the original value and sync when
+            # the transaction is closed.
+            owner._pending_changes.setdefault(change['name'], change['old'])
+            return
+        self._sync_changes(owner, [change['name']])
+
+    def _sync_changes(self, owner, names):
+        """
+        Sync the current values of some traits to MongoDB as one revision.
+        """
         collection_name = TYPES_TO_COLLECTION_NAMES[type(owner)]
         collection = self._db[collection_name]
         revisions = self._db[f'{collection_name}_revisions']
-        # We need the JSON-safe value of the change, so do this instead of
-        # change['new'].
-        new = change['owner'].to_dict()[change['name']]
+        # We need the JSON-safe values of the changes.
+        new = owner.to_dict()
         filter = {'uuid': owner.uuid}
-        update = {'$set': {change['name']: new},
+        update = {'$set': {name: new[name] for name in names},
                   '$inc': {'revision': 1}}
         # TODO Use transactions for this once we have MongoDB 4.0+.
-        # Increment the revision number.
-        owner.set_trait('revision', owner.revision + 1)
-        # Update the document in {collection_name}.
-        original = collection.find_one_and_update(filter, update)
+        original = None
+        if not self._is_snapshot(owner.revision):
+            # Only the previous values of the changed fields are stored, so
+            # fetch just those, provided that the document is still at the
+            # revision we have.
+            projection = {'uuid': True, 'revision': True,
+                          **{name: True for name in names}}
+            original = collection.find_one_and_update(
+                {**filter, 'revision': owner.revision}, update,
+                projection=projection)
+        if original is None:
+            # A snapshot is due, or someone else has changed the document
+            # since we loaded it, so we cannot tell yet whether this revision
+            # is stored in full. Fetch all of it.
+            original = collection.find_one_and_update(filter, update)
         # Remove the internal MongoDB id.
         original.pop('_id')
         # Insert the old version in {collection_name}_revisions
-        revisions = revisions.insert_one(original)
+        revisions.insert_one(_revision_document(
+            original, names, self._is_snapshot(original['revision'])))
+        up_to_date = original['revision'] == owner.revision
+        if not up_to_date:
+            # Someone else changed the document since we loaded it. original
+            # is their version in full, so catch up with their changes to the
+            # other fields.
+            owner._refresh(original, exclude=names)
+        owner.set_trait('revision', original['revision'] + 1)
+        if self._cache is not None:
+            key = (collection_name, owner.uuid)
+            if up_to_date:
+                self._cache.put(key, {**new, 'revision': owner.revision})
+            else:
+                # Other fields may have been changed by someone else.
+                self._cache.invalidate(key)
+
+    def _update_documents(self, obj_type, filter, changes, batch_size):
+        """
+        Apply the same changes to every matching document.
+        """
+        _check_changes(obj_type, changes)
+        property_validators = obj_type._property_validators
+        if property_validators is not None:
+            for name, value in changes.items():
+                property_validators[name].validate(value)
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        collection = self._db[collection_name]
+        revisions = self._db[f'{collection_name}_revisions']
+        update = {'$set': changes, '$inc': {'revision': 1}}
+        # The bulk update relies on this to detect conflicting writes.
+        collection.create_index('uuid', unique=True)
+        count = 0
+        last_uuid = None
+        while True:
+            # Walk the matches in batches ordered by uuid, re-running the
+            # query each time, so documents are never visited twice even if
+            # the changes affect how they sort or whether they match.
+            query = filter
+            if last_uuid is not None:
+                query = {'$and': [filter, {'uuid': {'$gt': last_uuid}}]}
+            originals = list(collection.find(query)
+                                       .sort('uuid', pymongo.ASCENDING)
+                                       .limit(batch_size))
+            if not originals:
+                return count
+            last_uuid = originals[-1]['uuid']
+            while originals:
+                for original in originals:
+                    original.pop('_id')  # Remove the internal MongoDB id.
+                    if property_validators is None:
+                        # The schema has cross-field constraints.
+                        obj_type._validator.validate({**original, **changes})
+                applied = _update_revisions(collection, originals, update)
+                updated = [original for original, ok in zip(originals, applied)
+                           if ok]
+                conflicts = [original['uuid']
+                             for original, ok in zip(originals, applied)
+                             if not ok]
+                count += len(updated)
+                # TODO Use transactions for this once we have MongoDB 4.0+.
+                # Insert the old versions in {collection_name}_revisions
+                if updated:
+                    revisions.insert_many(
+                        [_revision_document(
+                            original, changes,
+                            self._is_snapshot(original['revision']))
+                         for original in updated])
+                for original in updated:
+                    key = (collection_name, original['uuid'])
+                    if self._cache is not None:
+                        self._cache.invalidate(key)
+                    # Bring any live object up to date.
+                    obj = self._identity_map.get((obj_type, original['uuid']))
+                    if obj is not None and obj.revision == original['revision']:
+                        obj._refresh(changes)
+                        obj.set_trait('revision', original['revision'] + 1)
+                # Re-read the documents that were changed in the meantime and
+                # try again with those that still match.
+                originals = []
+                if conflicts:
+                    originals = list(collection.find(
+                        {'$and': [filter, {'uuid': {'$in': conflicts}}]}))
+
+    def _update_document(self, obj_type, uuid, changes):
+        """
+        Apply JSON-safe changes to a document as one new revision.
+
+        This works on the stored document, not on a live object, so several
+        threads may update the same document at once. Live objects are left
+        alone; one that is now out of date is caught up when it next syncs.
+
+        Returns the updated document, or None if there is no such document.
+        """
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        collection = self._db[collection_name]
+        revisions = self._db[f'{collection_name}_revisions']
+        while True:
+            original = collection.find_one({'uuid': uuid})
+            if original is None:
+                return None
+            original.pop('_id')  # Remove the internal MongoDB id.
+            obj_type._validator.validate({**original, **changes})
+            # Update only if no one else has changed the document since we
+            # read it, so that original is the revision being replaced.
+            document = collection.find_one_and_update(
+                {'uuid': uuid, 'revision': original['revision']},
+                {'$set': changes, '$inc': {'revision': 1}},
+                return_document=pymongo.ReturnDocument.AFTER)
+            if document is not None:
+                break
+        document.pop('_id')
+        # TODO Use transactions for this once we have MongoDB 4.0+.
+        # Insert the old version in {collection_name}_revisions
+        revisions.insert_one(_revision_document(
+            original, changes, self._is_snapshot(original['revision'])))
+        if self._cache is not None:
+            self._cache.invalidate((collection_name, uuid))
+        return document
+
+    def _revert_document(self, obj_type, uuid, num):
+        """
+        Restore an earlier revision of a document as one new revision.
+
+        Like _update_document, this does not use live objects. Returns the
+        updated document.
+        """
+        document = self._find_revision(obj_type, uuid, num)
+        if document is None:
+            raise ValueError(f'revision {num} you were '
+                             f'trying to revert to was not found')
+        # Include unchanged fields too, so that the revert is always recorded
+        # as a revision.
+        changes = {name: document[name]
+                   for name, trait in obj_type.class_traits().items()
+                   if not trait.read_only and name in document}
+        return self._update_document(obj_type, uuid, changes)
+
+    def _is_snapshot(self, revision):
+        """
+        Whether the given revision is stored in full in _revisions.
+        """
+        return (self._revision_storage == 'full' or
+                revision % self._snapshot_interval == 0)
+
+    def _revert(self, obj, num):
+        """
+        Restore an earlier revision of an object as one new revision.
+        """
+        type_ = type(obj)
+        document = self._find_revision(type_, obj.uuid, num)
+        if document is None:
+            raise ValueError(f'revision {num} you were '
+                             f'trying to revert to was not found')
+        fields = {name: type_._from_json(self, name, document[name])
+                  for name, trait in obj.traits().items()
+                  if not trait.read_only and name in document}
+        with obj.transaction():
+            for name, value in fields.items():
+                setattr(obj, name, value)
+                # Include unchanged fields too, so that the revert is always
+                # recorded as a revision.
+                obj._pending_changes.setdefault(name, value)
 
     def _purge(self, obj_type, uuid):
         collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
@@ -102,10 +451,36 @@ class Client:
         original = collection.find_one(filter)
         # Remove the internal MongoDB id.
         _id = original.pop('_id')
-        revisions = revisions.insert(original)
+        revisions.insert_one(original)
         # Restore the internal MongoDB id.
         original['_id'] = _id
         collection.delete_one(original)
+        self._identity_map.pop((obj_type, uuid), None)
+        if self._cache is not None:
+            self._cache.invalidate((collection_name, uuid))
+
+    def _find_one_by_uuid(self, collection_name, uuid):
+        """
+        Look up a document by uuid, using the cache.
+        """
+        collection = self._db[collection_name]
+        key = (collection_name, uuid)
+
+        def is_current(document):
+            current = collection.find_one(
+                {'uuid': uuid}, projection={'_id': False, 'revision': True})
+            return (current is not None and
+                    current['revision'] == document['revision'])
+
+        document = self._cache.get(
+            key, is_current if self._cache_validation else None)
+        if document is None:
+            document = collection.find_one({'uuid': uuid})
+            if document is None:
+                return None
+            document.pop('_id')  # Remove the internal MongoDB id.
+            self._cache.put(key, document)
+        return document
 
     def _document_to_obj(self, obj_type, document):
         """
@@ -124,16 +499,61 @@ class Client:
 
         return obj
 
-    def _revisions(self, obj):
+    def _revisions(self, obj, *, before=None, limit=None):
         """
-        Access all revisions to an object with the most recent first.
+        Access revisions to an object with the most recent first.
+
+        Parameters
+        ----------
+        obj: AmostraDocument
+        before: int, optional
+            Start with the revision just before this revision number.
+        limit: int, optional
+            Maximum number of revisions
         """
-        revisions = self._db[f'{TYPES_TO_COLLECTION_NAMES[type(obj)]}_revisions']
         type_ = type(obj)
-        for document in (revisions.find({'uuid': obj.uuid})
-                                  .sort('revision', pymongo.DESCENDING)):
-            document.pop('_id')  # Remove the internal MongoDB id.
-            yield type_.from_document(self, document)
+        collection_name = TYPES_TO_COLLECTION_NAMES[type_]
+        revisions = self._db[f'{collection_name}_revisions']
+        query = {'uuid': obj.uuid}
+        if before is not None:
+            query['revision'] = {'$lt': before}
+        cursor = revisions.find(query).sort('revision', pymongo.DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        def get_current():
+            # The document that follows the first revision in the cursor
+            if before is not None:
+                document = self._find_revision(type_, obj.uuid, before)
+                if document is not None:
+                    return document
+            return self._db[collection_name].find_one({'uuid': obj.uuid})
+
+        for page in _pages(_apply_deltas(get_current, cursor),
+                           page_size=min(limit or PAGE_SIZE, PAGE_SIZE)):
+            yield from type_.from_documents(self, page)
+
+    def _find_revision(self, obj_type, uuid, num):
+        """
+        Return the raw document for one revision, or None if not found.
+        """
+        collection_name = TYPES_TO_COLLECTION_NAMES[obj_type]
+        revisions = self._db[f'{collection_name}_revisions']
+        document = revisions.find_one({'uuid': uuid, 'revision': num})
+        if document is None or '_delta' not in document:
+            return document
+        # Reconstruct it, starting from the closest later full copy.
+        later = {'uuid': uuid, 'revision': {'$gt': num}}
+        start = revisions.find_one({**later, '_delta': {'$exists': False}},
+                                   sort=[('revision', pymongo.ASCENDING)])
+        if start is None:
+            start = self._db[collection_name].find_one({'uuid': uuid})
+        cursor = (revisions.find({'uuid': uuid,
+                                  'revision': {'$gte': num,
+                                               '$lt': start['revision']}})
+                           .sort('revision', pymongo.DESCENDING))
+        *_, document = _apply_deltas(lambda: start, cursor)
+        return document
 
 
 class CollectionAccessor:
@@ -148,19 +568,450 @@ class CollectionAccessor:
     def new(self, *args, **kwargs):
         return self._client._new_document(self._obj_type, args, kwargs)
 
-    def find(self, filter):
+    def new_many(self, documents, *, ordered=True, chunk_size=1000):
+        """
+        Create many documents, validating all of them before inserting any.
+
+        Parameters
+        ----------
+        documents: iterable of dicts
+            Traits for each new object, as would be passed to ``new``
+        ordered: bool, optional
+            If True (default), stop inserting at the first error. If False,
+            attempt to insert all documents, which may be faster.
+        chunk_size: int, optional
+            Maximum number of documents inserted in one request
+
+        Returns
+        -------
+        objs: list
+        """
+        return self._client._new_documents(self._obj_type, documents,
+                                           ordered, chunk_size)
+
+    def update_many(self, filter, changes, *, batch_size=1000):
+        """
+        Apply the same changes to all matching documents.
+
+        Each document gets a new revision, and its previous version is
+        recorded, as when changing a trait of an object. This is done in
+        bulk, batch_size documents at a time. A document changed by someone
+        else in the meantime is read again, and updated if it still matches.
+        This relies on a unique index on uuid, which is created if needed.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        changes: dict
+            Maps trait names to new JSON-serializable values
+        batch_size: int, optional
+
+        Returns
+        -------
+        count: int
+            Number of documents updated
+
+        Examples
+        --------
+
+        >>> client.samples.update_many({'projects': 'A'}, {'tags': ['A']})
+        """
+        return self._client._update_documents(self._obj_type, filter,
+                                              changes, batch_size)
+
+    def update(self, uuid, changes):
+        """
+        Change some fields of a document, as one new revision.
+
+        Unlike changing a live object, this is safe to do from several
+        threads at once.
+
+        Parameters
+        ----------
+        uuid: string
+        changes: dict
+            Maps trait names to new JSON-serializable values
+
+        Returns
+        -------
+        revision: int or None
+            The new revision number, or None if there is no such document
+        """
+        _check_changes(self._obj_type, changes)
+        document = self._client._update_document(self._obj_type, uuid,
+                                                 changes)
+        if document is None:
+            return None
+        return document['revision']
+
+    def find(self, filter, readonly=False, fields=None, *,
+             sort=None, limit=None, skip=None):
+        """
+        Search for documents.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        readonly: bool, optional
+            If True, yield lightweight read-only records instead of live
+            objects. Use ``record.promote()`` to get a live object.
+        fields: list, optional
+            If given, fetch only these fields (plus uuid and revision) and
+            yield partial read-only records.
+        sort: string or list, optional
+            A field name to sort by in ascending order, or a list of
+            ``(field, direction)`` pairs where direction is 1 (ascending) or
+            -1 (descending)
+        limit: int, optional
+            Maximum number of results
+        skip: int, optional
+            Number of results to skip
+
+        Examples
+        --------
+
+        The first 50 samples in reverse alphabetical order:
+
+        >>> client.samples.find({}, sort=[('name', -1)], limit=50)
+        """
         if filter is None:
             filter = {}
-        for document in self._collection.find(filter):
+        projection = None
+        if fields is not None:
+            readonly = True
+            projection = {'_id': False, 'uuid': True, 'revision': True,
+                          **{field: True for field in fields}}
+        cursor = self._collection.find(filter, projection,
+                                       sort=normalize_sort(sort),
+                                       limit=limit or 0, skip=skip or 0)
+        for page in _pages(cursor):
+            yield from self._to_objs(page, readonly)
+
+    def find_one(self, filter, readonly=False, fields=None):
+        """
+        Find the first matching document, or None.
+
+        Parameters
+        ----------
+        filter: dict
+            MongoDB query
+        readonly: bool, optional
+            If True, return a lightweight read-only record instead of a live
+            object.
+        fields: list, optional
+            If given, fetch only these fields (plus uuid and revision) and
+            return a partial read-only record.
+        """
+        if fields is not None:
+            return next(self.find(filter, fields=fields, limit=1), None)
+        if (self._client._cache is not None and
+                list(filter or {}) == ['uuid'] and
+                isinstance(filter['uuid'], str)):
+            document = self._client._find_one_by_uuid(
+                self._collection.name, filter['uuid'])
+            if document is None:
+                return None
+        else:
+            document = self._collection.find_one(filter)
+            if document is None:
+                return None
             document.pop('_id')  # Remove the internal MongoDB id.
-            yield self._obj_type.from_document(self._client, document)
+        return self._to_objs([document], readonly)[0]
 
-    def find_one(self, filter):
-        document = self._collection.find_one(filter)
-        if document is None:
-            return None
-        document.pop('_id')  # Remove the internal MongoDB id.
-        return self._obj_type.from_document(self._client, document)
+    def count(self, filter=None, *, estimated=False):
+        """
+        Count documents without fetching them.
+
+        Parameters
+        ----------
+        filter: dict, optional
+            MongoDB query
+        estimated: bool, optional
+            If True, return a fast estimate of the total number of documents
+            from the collection metadata. This cannot be combined with a
+            filter.
+
+        Returns
+        -------
+        count: int
+        """
+        if estimated:
+            if filter:
+                raise ValueError("An estimated count cannot take a filter.")
+            return self._collection.estimated_document_count()
+        return self._collection.count_documents(filter or {})
+
+    def distinct(self, field, filter=None):
+        """
+        List the distinct values of a field.
+
+        For a list-valued field, such as ``tags``, this lists the distinct
+        items.
+
+        Parameters
+        ----------
+        field: string
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        values: list
+        """
+        return self._collection.distinct(field, filter)
+
+    def facets(self, fields, filter=None):
+        """
+        Count the documents having each value of some fields.
+
+        For a list-valued field, such as ``tags``, this counts each item.
+
+        Parameters
+        ----------
+        fields: list
+            Field names
+        filter: dict, optional
+            MongoDB query
+
+        Returns
+        -------
+        facets: dict
+            Maps each field to a dict of ``{value: count}``, most common
+            value first
+
+        Examples
+        --------
+
+        >>> client.samples.facets(['tags', 'projects'])
+        {'tags': {'powder': 12, 'wet': 3}, 'projects': {'proj-1': 15}}
+        """
+        fields = list(fields)
+        result, = self._collection.aggregate(_facets_pipeline(fields, filter))
+        return _facets_result(fields, result)
+
+    def _to_objs(self, documents, readonly):
+        if readonly:
+            return [self._obj_type._record_type(self._client, document)
+                    for document in documents]
+        return self._obj_type.from_documents(self._client, documents)
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class DocumentCache:
+    """
+    A thread-safe, bounded LRU cache of documents.
+
+    Keys are (collection_name, uuid). Copies go in and out, so callers may
+    consume the documents they get.
+    """
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._documents = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = 0
+
+    def get(self, key, is_current=None):
+        """
+        Return a copy of the cached document, or None.
+
+        Parameters
+        ----------
+        key: tuple
+            (collection_name, uuid)
+        is_current: callable, optional
+            Called with the cached document. If it returns False, the
+            document is discarded and this counts as a miss.
+        """
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+        if document is not None and is_current is not None:
+            if not is_current(document):
+                self.invalidate(key)
+                document = None
+        with self._lock:
+            if document is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return copy.deepcopy(document)
+
+    def put(self, key, document):
+        document = copy.deepcopy(document)
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self._maxsize:
+                self._documents.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._documents.pop(key, None)
+
+    def clear(self, collection_name=None):
+        """
+        Discard all documents, or all documents from one collection.
+        """
+        with self._lock:
+            if collection_name is None:
+                self._documents.clear()
+            else:
+                for key in [key for key in self._documents
+                            if key[0] == collection_name]:
+                    del self._documents[key]
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions,
+                             self._maxsize, len(self._documents))
+
+
+def _apply_deltas(get_current, revisions):
+    """
+    Reconstruct full documents from revisions sorted most recent first.
+
+    Parameters
+    ----------
+    get_current: callable
+        Returns the document that follows the first of the revisions. It is
+        only called if the first revision is not a full copy.
+    revisions: iterable
+        Entries from {collection_name}_revisions, either full copies or
+        {'uuid', 'revision', '_delta'} where _delta holds the values that
+        the changed fields had in that revision.
+    """
+    document = None
+    for revision in revisions:
+        if '_delta' in revision and document is None:
+            document = get_current()
+        document = _reconstruct(document, revision)
+        # Yield a copy because from_document consumes it.
+        yield dict(document)
+
+
+def _reconstruct(following, revision):
+    """
+    Make the full document for a revision.
+
+    Parameters
+    ----------
+    following: dict or None
+        The full document for the next revision. It is needed only if the
+        revision is stored as a delta.
+    revision: dict
+        An entry from {collection_name}_revisions
+    """
+    revision.pop('_id', None)  # Remove the internal MongoDB id.
+    if '_delta' not in revision:
+        return revision
+    following.pop('_id', None)  # Remove the internal MongoDB id.
+    return {**following, **revision['_delta'],
+            'revision': revision['revision']}
+
+
+def _revision_document(original, names, snapshot):
+    """
+    Make the {collection_name}_revisions entry for a previous version.
+
+    Unless it is a snapshot, only the values of the changed fields are kept.
+    """
+    if snapshot:
+        return original
+    return {'uuid': original['uuid'], 'revision': original['revision'],
+            '_delta': {name: original[name] for name in names
+                       if name in original}}
+
+
+def _update_revisions(collection, originals, update):
+    """
+    Update documents in one bulk write, each only if it is still at the
+    revision read, so that the original is the revision being replaced.
+
+    Returns a list saying, for each original, whether it was updated.
+
+    A bulk write reports how many updates matched, but not which, so each
+    update is an upsert. If someone else has changed a document, the upsert
+    tries to insert a second document with the same uuid, and the unique
+    index on uuid rejects it with an error that gives its position.
+    """
+    try:
+        result = collection.bulk_write(
+            [pymongo.UpdateOne({'uuid': original['uuid'],
+                                'revision': original['revision']},
+                               update, upsert=True)
+             for original in originals],
+            ordered=False)
+        details = result.bulk_api_result
+    except pymongo.errors.BulkWriteError as err:
+        details = err.details
+        if any(error['code'] != DUPLICATE_KEY_ERROR
+               for error in details['writeErrors']):
+            raise
+    failed = {error['index'] for error in details['writeErrors']}
+    if details['upserted']:
+        # These documents were purged meanwhile, so the upsert inserted
+        # them anew. Remove them again.
+        collection.delete_many(
+            {'_id': {'$in': [upserted['_id']
+                             for upserted in details['upserted']]}})
+        failed.update(upserted['index'] for upserted in details['upserted'])
+    return [i not in failed for i in range(len(originals))]
+
+
+def _check_changes(obj_type, changes):
+    """
+    Raise ValueError if changes include any field that cannot be updated.
+    """
+    traits = obj_type.class_traits()
+    for name in changes:
+        if name not in traits or traits[name].read_only:
+            raise ValueError(f"{name!r} is not a trait of "
+                             f"{obj_type.__name__} that can be updated")
+
+
+def _facets_pipeline(fields, filter):
+    """
+    Make an aggregation pipeline counting the documents with each value.
+
+    All the fields are counted in one pass, with a sub-pipeline per field.
+    Facet names may not contain dots, so the positions are used instead.
+    """
+    return [
+        {'$match': filter or {}},
+        {'$facet': {str(i): [{'$unwind': f'${field}'},
+                             {'$group': {'_id': f'${field}',
+                                         'count': {'$sum': 1}}},
+                             {'$sort': {'count': -1, '_id': 1}}]
+                    for i, field in enumerate(fields)}}]
+
+
+def _facets_result(fields, result):
+    "Convert the result of _facets_pipeline to {field: {value: count}}."
+    return {field: {group['_id']: group['count'] for group in result[str(i)]}
+            for i, field in enumerate(fields)}
+
+
+def _pages(cursor, page_size=PAGE_SIZE):
+    """
+    Consume a cursor in lists of documents with the MongoDB id removed.
+
+    This lets objects referencing other documents (e.g. a Container's
+    contents) resolve them for a whole page of results at once.
+    """
+    while True:
+        page = list(itertools.islice(cursor, page_size))
+        if not page:
+            return
+        for document in page:
+            document.pop('_id', None)  # Remove the internal MongoDB id.
+        yield page
 
 
 def _get_database(uri):
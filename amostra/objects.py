@@ -1,3 +1,6 @@
+import collections.abc
+import contextlib
+import inspect
 import uuid
 
 import jsonschema
@@ -7,7 +10,9 @@ from traitlets import (
     Instance,
     Integer,
     List,
+    TraitType,
     Unicode,
+    Union,
     default,
     validate,
 )
@@ -15,32 +20,111 @@ from traitlets import (
 from .utils import load_schema
 
 
+def _compile_validator(schema):
+    """
+    Check a jsonschema once and return a reusable validator for it.
+
+    This avoids re-checking the schema against its meta-schema and rebuilding
+    the validator every time a document is validated, as
+    ``jsonschema.validate`` does.
+    """
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+# Schema keywords that constrain a document as a whole rather than one
+# property at a time. If a schema uses any of these, validating a single
+# changed property is not sufficient.
+_CROSS_FIELD_KEYWORDS = {
+    'allOf', 'anyOf', 'oneOf', 'not', 'if', 'then', 'else',
+    'dependencies', 'dependentRequired', 'dependentSchemas',
+    'patternProperties', 'propertyNames', 'minProperties', 'maxProperties',
+    'unevaluatedProperties', '$ref',
+}
+
+
+def _compile_property_validators(schema):
+    """
+    Return a validator for each property's sub-schema, or None.
+
+    None indicates that the schema has cross-field constraints, so every
+    change must be validated against the whole document.
+    """
+    if _CROSS_FIELD_KEYWORDS & set(schema):
+        return None
+    validator_class = jsonschema.validators.validator_for(schema)
+    return {name: validator_class(subschema)
+            for name, subschema in schema.get('properties', {}).items()}
+
+
 def _validate_with_jsonschema(instance, proposal):
     """
     Validate that contents satisfy a jsonschema.
 
     This is meant to be used with traitlets' @validate decorator.
+
+    Only the changed property is validated against its own sub-schema, unless
+    the schema declares cross-field constraints. The whole document is
+    validated once when the object is created; see AmostraDocument.__init__.
     """
-    jsonschema.validate(instance.to_dict(), instance.SCHEMA)
+    if instance._initializing:
+        return proposal['value']
+    name = proposal['trait'].name
+    value = instance._to_json(name, proposal['value'])
+    property_validators = instance._property_validators
+    if property_validators is not None and name in property_validators:
+        property_validators[name].validate(value)
+    else:
+        document = instance.to_dict()
+        document[name] = value
+        instance._validator.validate(document)
     return proposal['value']
 
 
+def _is_trait(obj):
+    return isinstance(obj, TraitType)
+
+
 class AmostraDocument(HasTraits):
     """
     A HasTraits object with a reference to an amostra client.
     """
     uuid = Unicode(read_only=True)
     revision = Integer(0, read_only=True)
+    # Maps trait name to original value while a transaction is open.
+    _pending_changes = None
 
     def __init__(self, _amostra_client, *args, **kwargs):
         self._amostra_client = _amostra_client
+        # Skip per-property validation while the traits are first set, and
+        # validate the complete document once at the end instead.
+        self._initializing = True
         super().__init__(*args, **kwargs)
-
-    def __new__(cls, *args, **kwargs):
-        # Configure _validate_with_jsonschema to validate all traits.
-        trait_names = list(cls.class_traits())
-        cls._validate = validate(*trait_names)(_validate_with_jsonschema)
-        return super().__new__(cls, *args, **kwargs)
+        self._initializing = False
+        self._validator.validate(self.to_dict())
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Compile the validators and configure _validate_with_jsonschema to
+        # validate all traits once per class, when the class is defined, not
+        # on every instantiation. This runs before traitlets' metaclass
+        # collects the class's descriptors, so the handler is registered on
+        # each instance by traitlets itself.
+        if 'SCHEMA' in cls.__dict__:
+            cls._validator = _compile_validator(cls.SCHEMA)
+            cls._property_validators = _compile_property_validators(
+                cls.SCHEMA)
+            # cls.class_traits() is not populated yet at this point.
+            trait_names = [name for name, _ in
+                           inspect.getmembers(cls, _is_trait)]
+            cls._validate = validate(*trait_names)(_validate_with_jsonschema)
+            # A read-only counterpart, e.g. SampleRecord for Sample
+            cls._record_type = type(f'{cls.__name__}Record', (Record,),
+                                    {'__slots__': tuple(trait_names),
+                                     '__module__': cls.__module__,
+                                     '_obj_type': cls,
+                                     '_fields': tuple(trait_names)})
 
     @default('uuid')
     def _get_default_uuid(self):
@@ -57,9 +141,25 @@ class AmostraDocument(HasTraits):
         Represent the object as a JSON-serializable dictionary.
         """
         with self.cross_validation_lock:
-            result = {name: getattr(self, name) for name in self.trait_names()}
+            result = {name: self._to_json(name, getattr(self, name))
+                      for name in self.trait_names()}
         return result
 
+    def _to_json(self, name, value):
+        """
+        Convert the value of the trait ``name`` to a JSON-serializable value.
+        """
+        return value
+
+    @classmethod
+    def _from_json(cls, amostra_client, name, value):
+        """
+        Convert a JSON value for the trait ``name`` to a trait value.
+
+        This is the inverse of :meth:`_to_json`.
+        """
+        return value
+
     @classmethod
     def from_document(cls, amostra_client, document):
         """
@@ -68,15 +168,87 @@ class AmostraDocument(HasTraits):
         # Handle the read_only traits separately.
         uuid = document.pop('uuid')
         revision = document.pop('revision')
-        instance = cls(amostra_client, **document)
+        # If this client already has a live object for this revision of the
+        # document, reuse it.
+        identity_map = amostra_client._identity_map
+        existing = identity_map.get((cls, uuid))
+        if existing is not None and existing.revision == revision:
+            return existing
+        instance = cls(amostra_client,
+                       **{name: cls._from_json(amostra_client, name, value)
+                          for name, value in document.items()})
         instance.set_trait('uuid', uuid)
         instance.set_trait('revision', revision)
 
         # Observe any updates to the instanceect and sync them to MongoDB.
         instance.observe(amostra_client._update)
 
+        # Older revisions, as from revisions(), do not displace the live
+        # object.
+        if existing is None or existing.revision < revision:
+            identity_map[(cls, uuid)] = instance
         return instance
 
+    @classmethod
+    def from_documents(cls, amostra_client, documents):
+        """
+        Convert a batch of dicts returned by the server to objects.
+
+        Subclasses may override this to share work across the batch.
+        """
+        return [cls.from_document(amostra_client, document)
+                for document in documents]
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Sync all the changes made within a block as one revision.
+
+        If the block raises, the changes are rolled back and nothing is
+        synced.
+
+        Examples
+        --------
+
+        >>> with sample.transaction():
+        ...     sample.name = 'grape jelly'
+        ...     sample.tags = ['sweet', 'sticky']
+        """
+        if self._pending_changes is not None:
+            # This is nested inside another transaction, which will sync.
+            yield
+            return
+        self._pending_changes = {}
+        try:
+            yield
+        except BaseException:
+            # Restore the original values. They are recorded as pending
+            # changes, which are then discarded.
+            for name, value in self._pending_changes.items():
+                setattr(self, name, value)
+            self._pending_changes = None
+            raise
+        pending, self._pending_changes = self._pending_changes, None
+        if pending:
+            self._amostra_client._sync_changes(self, list(pending))
+
+    def update(self, **fields):
+        """
+        Change several traits at once and sync them as one revision.
+
+        Examples
+        --------
+
+        >>> sample.update(name='grape jelly', tags=['sweet', 'sticky'])
+        """
+        for name in fields:
+            if not self.has_trait(name):
+                raise AttributeError(
+                    f'{self.__class__.__name__} has no trait {name!r}')
+        with self.transaction():
+            for name, value in fields.items():
+                setattr(self, name, value)
+
     def revisions(self):
         """
         Access all revisions of this document.
@@ -111,19 +283,97 @@ class AmostraDocument(HasTraits):
         self._amostra_client._purge(type(self), self.uuid)
 
     def revert(self, num):
-        # Find the one you want to revert to
-        for it in self.revisions():
-            if it.revision == num:
-                break
-        else:
-            raise ValueError(f'revision {num} you were'
-                             f'trying to revert to was not found')
-
-        # Update current sample
-        with self.hold_trait_notifications():
+        """
+        Restore the traits of an earlier revision, as one new revision.
+
+        Parameters
+        ----------
+        num: int
+            Revision number to revert to
+        """
+        self._amostra_client._revert(self, num)
+
+    @contextlib.contextmanager
+    def _unsynced(self):
+        """
+        Change traits locally, without syncing the changes.
+        """
+        # The changes are recorded as if in a transaction, and discarded.
+        outer, self._pending_changes = self._pending_changes, {}
+        try:
+            yield
+        finally:
+            self._pending_changes = outer
+
+    def _refresh(self, document, exclude=()):
+        """
+        Set traits to the JSON values in a document, without syncing.
+
+        Fields missing from the document, read-only traits and the names in
+        exclude are left alone.
+        """
+        with self._unsynced():
             for name, trait in self.traits().items():
-                if not trait.read_only:
-                    setattr(self, name, getattr(it, name))
+                if (not trait.read_only and name in document and
+                        name not in exclude):
+                    setattr(self, name,
+                            self._from_json(self._amostra_client, name,
+                                            document[name]))
+
+
+class Record:
+    """
+    A lightweight, immutable view of a document.
+
+    These are returned by searches with ``readonly=True`` or ``fields=[...]``.
+    They have the same field names as the corresponding traitlets-based object
+    (e.g. Sample) but no validation and no syncing, so they are much cheaper
+    to create and hold in memory. Records from searches with ``fields`` have
+    only those fields, plus uuid and revision. Use :meth:`promote` to obtain a
+    live, editable object.
+    """
+    __slots__ = ('_amostra_client',)
+    _obj_type = None
+    _fields = ()
+
+    def __init__(self, _amostra_client, document):
+        object.__setattr__(self, '_amostra_client', _amostra_client)
+        for name in self._fields:
+            if name in document:
+                object.__setattr__(self, name, document[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{self.__class__.__name__} is read-only')
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(' +
+                ', '.join(f'{name}={value!r}'
+                          for name, value in self.to_dict().items()
+                          if name not in ('uuid', 'revision')) + ')')
+
+    def to_dict(self):
+        """
+        Represent the record as a JSON-serializable dictionary.
+        """
+        return {name: getattr(self, name) for name in self._fields
+                if hasattr(self, name)}
+
+    def promote(self):
+        """
+        Return a live, editable object (e.g. Sample) for this document.
+
+        If this record has only some of the fields, as when it was found with
+        ``fields=[...]``, the full document is fetched.
+        """
+        if all(hasattr(self, name) for name in self._fields):
+            return self._obj_type.from_document(self._amostra_client,
+                                                self.to_dict())
+        accessor = getattr(self._amostra_client,
+                           TYPES_TO_COLLECTION_NAMES[self._obj_type])
+        return accessor.find_one({'uuid': self.uuid})
 
 
 class Institution(AmostraDocument):
@@ -168,11 +418,112 @@ class Sample(AmostraDocument):
         super().__init__(_amostra_client, name=name, **kwargs)
 
 
+def _resolve_contents(amostra_client, lazy_contents):
+    """
+    Fetch the Samples for several LazyContents in one query.
+    """
+    unresolved = [contents for contents in lazy_contents
+                  if not contents.resolved]
+    sample_uuids = set()
+    for contents in unresolved:
+        sample_uuids.update(contents._locations)
+    samples = {}
+    if sample_uuids:
+        query = {'uuid': {'$in': sorted(sample_uuids)}}
+        for sample in amostra_client.samples.find(query):
+            samples[sample.uuid] = sample
+    for contents in unresolved:
+        # Samples that no longer exist are left out.
+        contents._locations = {
+            sample_uuid: location
+            for sample_uuid, location in contents._locations.items()
+            if sample_uuid in samples}
+        contents._samples = {sample_uuid: samples[sample_uuid]
+                             for sample_uuid in contents._locations}
+
+
+class LazyContents(collections.abc.Mapping):
+    """
+    A read-only mapping of Samples to locations, loaded on first access.
+
+    This holds the sample uuids from the database and only fetches the
+    Sample objects when the mapping is iterated. Lengths, lookups by Sample,
+    comparisons and serialization do not need the Samples, so they never
+    trigger a query. Containers loaded together, as from one page of search
+    results, fetch the Samples for all of their contents in one query on the
+    first access to any of them.
+
+    To change the contents of a Container, assign a new dict of
+    ``{Sample: location}`` to it.
+    """
+    def __init__(self, amostra_client, locations):
+        """
+        Parameters
+        ----------
+        amostra_client: Client
+        locations: dict
+            Maps sample uuid to location
+        """
+        self._amostra_client = amostra_client
+        self._locations = dict(locations)
+        self._samples = None
+        # Other LazyContents to resolve together with this one
+        self._batch = None
+
+    @property
+    def resolved(self):
+        "Whether the Samples have been fetched"
+        return self._samples is not None
+
+    def prefetch(self):
+        """
+        Fetch the Samples now, if they have not been fetched already.
+
+        This also fetches the Samples for any LazyContents loaded together
+        with this one.
+        """
+        batch = self._batch or [self]
+        _resolve_contents(self._amostra_client, batch)
+        for contents in batch:
+            contents._batch = None
+
+    def to_dict(self):
+        """
+        Represent the contents as {sample_uuid: location}.
+        """
+        return dict(self._locations)
+
+    def __getitem__(self, sample):
+        return self._locations[sample.uuid]
+
+    def __contains__(self, sample):
+        return getattr(sample, 'uuid', None) in self._locations
+
+    def __iter__(self):
+        self.prefetch()
+        return iter(self._samples.values())
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyContents):
+            return self._locations == other._locations
+        if isinstance(other, collections.abc.Mapping):
+            return self._locations == {k.uuid: v for k, v in other.items()}
+        return NotImplemented
+
+    def __repr__(self):
+        if self.resolved:
+            return repr(dict(self.items()))
+        return f'{self.__class__.__name__}({self._locations!r})'
+
+
 class Container(AmostraDocument):
     SCHEMA = load_schema('container.json')
     name = Unicode()
     kind = Unicode()
-    contents = Dict()
+    contents = Union([Instance(LazyContents), Dict()])
 
     def __init__(self, _amostra_client, *, name, kind, contents):
         """
@@ -189,24 +540,52 @@ class Container(AmostraDocument):
         super().__init__(_amostra_client, name=name, kind=kind,
                          contents=contents)
 
-    def to_dict(self):
+    def _to_json(self, name, value):
         # Replace Sample objects in contents with their uuids.
-        ret = super().to_dict()
-        ret['contents'] = {k.uuid: v for k, v in ret['contents'].items()}
-        return ret
+        if name == 'contents':
+            if isinstance(value, LazyContents):
+                return value.to_dict()
+            return {k.uuid: v for k, v in value.items()}
+        return value
 
     @classmethod
-    def from_document(cls, amostra_client, document):
+    def _from_json(cls, amostra_client, name, value):
+        # Replace {sample_uuid: location} with a lazy {Sample: location}.
+        # The Samples are not fetched until they are accessed. See
+        # prefetch_contents.
+        if name == 'contents':
+            return LazyContents(amostra_client, value)
+        return value
+
+    @classmethod
+    def from_documents(cls, amostra_client, documents):
+        containers = super().from_documents(amostra_client, documents)
+        # Resolve the contents of the whole batch together, on first access.
+        batch = [container.contents for container in containers
+                 if isinstance(container.contents, LazyContents) and
+                 not container.contents.resolved]
+        for contents in batch:
+            contents._batch = batch
+        return containers
+
+    @staticmethod
+    def prefetch_contents(containers):
         """
-        Convert a dict returned by the server to our traitlets-based object.
+        Fetch the Samples in the contents of many Containers in one query.
+
+        Examples
+        --------
+
+        >>> containers = list(client.containers.find({}))
+        >>> Container.prefetch_contents(containers)
         """
-        contents = {}
-        # Replace {sample_uuid: location} with {Sample: location}.
-        for sample_uuid, location in document['contents'].items():
-            sample = amostra_client.samples.find_one({'uuid': sample_uuid})
-            contents[sample] = location
-        document['contents'] = contents
-        return super().from_document(amostra_client, document)
+        lazy_contents = {}
+        for container in containers:
+            if isinstance(container.contents, LazyContents):
+                lazy_contents.setdefault(container._amostra_client, []).append(
+                    container.contents)
+        for amostra_client, contents in lazy_contents.items():
+            _resolve_contents(amostra_client, contents)
 
 
 TYPES_TO_COLLECTION_NAMES = {
@@ -1,12 +1,17 @@
+import asyncio
 import logging
 import os
+import signal
+import sys
+import time
 
 import tornado.options
-from tornado import httpserver, ioloop, log, web
+from tornado import httpserver, httputil, ioloop, log, netutil, process, web
 from tornado.options import define, options
 
 from .handlers import init_handlers
 from .mongo_client import Client
+from .utils import InstrumentedExecutor, TTLCache
 
 
 def init_options():
@@ -18,6 +23,191 @@ def init_options():
     define("sslkey", help="path to ssl .key file", type=str)
     define("host", default=default_host, help="run on the given interface", type=str)
     define("port", default=default_port, help="run on the given port", type=int)
+    define("processes", default=1,
+           help="number of worker processes sharing the port "
+                "(0 for one per CPU)",
+           type=int)
+    define("max_restarts", default=100,
+           help="with multiple processes, how many times failed workers "
+                "are restarted before giving up",
+           type=int)
+    define("shutdown_timeout", default=10,
+           help="on SIGTERM, seconds to let requests in flight finish",
+           type=float)
+    define("revision_storage", default='full',
+           help="store previous revisions in 'full' or as 'delta'", type=str)
+    define("snapshot_interval", default=10,
+           help="with delta revision storage, store every Nth revision in full",
+           type=int)
+    define("cache_size", default=0,
+           help="number of documents to cache (validated on each access)",
+           type=int)
+    define("executor_threads", default=10,
+           help="number of threads running blocking database work "
+                "(0 to run it on the IOLoop thread)",
+           type=int)
+    define("async_driver", default=False,
+           help="serve the main routes with the asyncio client",
+           type=bool)
+    define("aggregation_cache_ttl", default=0,
+           help="seconds to cache distinct values and facet counts",
+           type=float)
+
+
+# Exit status of a worker that was asked to restart
+RESTART_STATUS = 3
+
+
+class Application(web.Application):
+    """
+    A tornado Application that counts the requests in flight.
+    """
+    in_flight = 0
+
+    def start_request(self, server_conn, request_conn):
+        # This is called before a request arrives on a connection, so only
+        # count the request once its headers are received.
+        return _CountingDelegate(
+            self, super().start_request(server_conn, request_conn))
+
+    def log_request(self, handler):
+        # This is called when each response is finished.
+        self.in_flight -= 1
+        super().log_request(handler)
+
+
+class _CountingDelegate(httputil.HTTPMessageDelegate):
+    def __init__(self, app, delegate):
+        self.app = app
+        self.delegate = delegate
+
+    def headers_received(self, start_line, headers):
+        self.app.in_flight += 1
+        return self.delegate.headers_received(start_line, headers)
+
+    def data_received(self, chunk):
+        return self.delegate.data_received(chunk)
+
+    def finish(self):
+        return self.delegate.finish()
+
+    def on_connection_close(self):
+        return self.delegate.on_connection_close()
+
+
+class GracefulShutdown:
+    """
+    Stop serving on a signal, letting requests in flight finish first.
+
+    On SIGTERM or SIGINT, the server stops accepting connections, waits up to
+    shutdown_timeout seconds for requests in flight, and stops the IOLoop.
+    If ``restart`` is True, this is a worker process: SIGHUP does the same
+    and sets ``exit_status`` to RESTART_STATUS, so that the parent process
+    starts a new worker in place of this one, and the worker shuts down if
+    the parent process exits.
+    """
+    def __init__(self, http_server, app, shutdown_timeout, restart=False):
+        self.http_server = http_server
+        self.app = app
+        self.shutdown_timeout = shutdown_timeout
+        self.exit_status = 0
+        self._stopping = False
+        statuses = {signal.SIGTERM: 0, signal.SIGINT: 0}
+        if restart:
+            statuses[signal.SIGHUP] = RESTART_STATUS
+        loop = ioloop.IOLoop.current().asyncio_loop
+        for signum, exit_status in statuses.items():
+            try:
+                loop.add_signal_handler(signum, self._on_signal, exit_status)
+            except NotImplementedError:
+                # Signal handlers cannot be added on Windows.
+                pass
+        if restart:
+            self._parent_pid = os.getppid()
+            ioloop.PeriodicCallback(self._check_parent, 1000).start()
+
+    def _check_parent(self):
+        # An orphaned process is adopted by another, so its parent changes.
+        if os.getppid() != self._parent_pid:
+            self._on_signal(0)
+
+    def _on_signal(self, exit_status):
+        if self._stopping:
+            return
+        self._stopping = True
+        self.exit_status = exit_status
+        ioloop.IOLoop.current().add_callback(self._shutdown)
+
+    async def _shutdown(self):
+        log.app_log.info("Shutting down (%d requests in flight)",
+                         self.app.in_flight)
+        self.http_server.stop()
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.app.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.app.in_flight > 0:
+            log.app_log.warning("Abandoning %d requests in flight",
+                                self.app.in_flight)
+        # Close idle keep-alive connections.
+        await self.http_server.close_all_connections()
+        ioloop.IOLoop.current().stop()
+
+
+def fork_workers(num_processes, max_restarts):
+    """
+    Start worker processes, and keep them running from the parent process.
+
+    This is like tornado.process.fork_processes, but a worker that exits with
+    RESTART_STATUS, as it does on SIGHUP, is replaced without counting toward
+    max_restarts. Only workers that fail count.
+
+    In each worker, this returns its task id, between 0 and num_processes - 1.
+    The parent process never returns: it exits once all the workers have
+    exited successfully, and raises RuntimeError after max_restarts failures.
+    """
+    if num_processes <= 0:
+        num_processes = process.cpu_count()
+    log.app_log.info("Starting %d processes", num_processes)
+    children = {}  # maps pid to task id
+
+    def start_child(task_id):
+        pid = os.fork()
+        if pid == 0:
+            return task_id
+        children[pid] = task_id
+        return None
+
+    for task_id in range(num_processes):
+        if start_child(task_id) is not None:
+            return task_id
+    num_restarts = 0
+    while children:
+        pid, status = os.wait()
+        if pid not in children:
+            continue
+        task_id = children.pop(pid)
+        exit_status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
+        if exit_status == 0:
+            log.app_log.info("Worker %d (pid %d) exited normally",
+                             task_id, pid)
+            continue
+        if exit_status == RESTART_STATUS:
+            log.app_log.info("Worker %d (pid %d) restarting", task_id, pid)
+        else:
+            if exit_status is None:
+                log.app_log.warning("Worker %d (pid %d) killed by signal %d, "
+                                    "restarting", task_id, pid,
+                                    os.WTERMSIG(status))
+            else:
+                log.app_log.warning("Worker %d (pid %d) exited with status "
+                                    "%d, restarting", task_id, pid,
+                                    exit_status)
+            num_restarts += 1
+            if num_restarts > max_restarts:
+                raise RuntimeError("Too many worker restarts, giving up")
+        if start_child(task_id) is not None:
+            return task_id
+    sys.exit(0)
 
 
 def make_app():
@@ -26,12 +216,27 @@ def make_app():
         options.debug = True
         logging.getLogger().setLevel('DEBUG')
 
+    mongo_client = Client(options.mongo_uri,
+                          revision_storage=options.revision_storage,
+                          snapshot_interval=options.snapshot_interval,
+                          cache_size=options.cache_size)
+    mongo_client.ensure_indexes()
     settings = dict(
         base_url=options.base_url,
-        mongo_client=Client(options.mongo_uri)
+        mongo_client=mongo_client,
     )
-    handlers = init_handlers()
-    return web.Application(handlers, debug=options.debug, **settings)
+    if options.executor_threads > 0:
+        settings['executor'] = InstrumentedExecutor(options.executor_threads)
+    if options.async_driver:
+        from .async_mongo_client import AsyncClient
+        settings['async_mongo_client'] = AsyncClient(
+            options.mongo_uri,
+            revision_storage=options.revision_storage,
+            snapshot_interval=options.snapshot_interval)
+    if options.aggregation_cache_ttl > 0:
+        settings['aggregation_cache'] = TTLCache(options.aggregation_cache_ttl)
+    handlers = init_handlers(asynchronous=options.async_driver)
+    return Application(handlers, debug=options.debug, **settings)
 
 
 def main(argv=None):
@@ -47,9 +252,6 @@ def main(argv=None):
         # which is just too much.
         curl_log.setLevel(max(log.app_log.getEffectiveLevel(), logging.INFO))
 
-    # create and start the app
-    app = make_app()
-
     # load ssl options
     ssl_options = None
     if options.sslcert:
@@ -58,11 +260,36 @@ def main(argv=None):
             'keyfile': options.sslkey,
         }
 
-    http_server = httpserver.HTTPServer(app, xheaders=True, ssl_options=ssl_options)
-    log.app_log.info("Listening on %s:%i, path %s", options.host, options.port,
-                     app.settings['base_url'])
-    http_server.listen(options.port, options.host)
+    if options.processes == 1:
+        # create and start the app
+        app = make_app()
+        http_server = httpserver.HTTPServer(app, xheaders=True,
+                                            ssl_options=ssl_options)
+        log.app_log.info("Listening on %s:%i, path %s", options.host,
+                         options.port, app.settings['base_url'])
+        http_server.listen(options.port, options.host)
+    else:
+        if options.debug or os.environ.get("DEBUG"):
+            raise ValueError("debug mode cannot be used with multiple "
+                             "processes")
+        # Bind the port before forking so that all the workers share it.
+        sockets = netutil.bind_sockets(options.port, options.host)
+        # The parent process stays in here, restarting workers as they exit.
+        task_id = fork_workers(options.processes, options.max_restarts)
+        # Create the app, and so its MongoDB connection pool, in each worker.
+        # A pymongo client must not be used across a fork.
+        app = make_app()
+        http_server = httpserver.HTTPServer(app, xheaders=True,
+                                            ssl_options=ssl_options)
+        log.app_log.info("Worker %d listening on %s:%i, path %s",
+                         task_id, options.host, options.port,
+                         app.settings['base_url'])
+        http_server.add_sockets(sockets)
+    shutdown = GracefulShutdown(http_server, app, options.shutdown_timeout,
+                                restart=options.processes != 1)
     ioloop.IOLoop.current().start()
+    if shutdown.exit_status:
+        sys.exit(shutdown.exit_status)
 
 
 if __name__ == '__main__':
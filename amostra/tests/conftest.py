@@ -1,9 +1,15 @@
+import asyncio
+import threading
 import uuid
 
 import pytest
 from pymongo import MongoClient
+from tornado import httpserver, ioloop, netutil
 
 import amostra.mongo_client
+from amostra.handlers import init_handlers
+from amostra.server import Application
+from amostra.utils import InstrumentedExecutor
 
 
 @pytest.fixture()
@@ -14,3 +20,46 @@ def client():
     yield client
     # Clean db at the end of whole test function.
     MongoClient(url).drop_database(db_name)
+
+
+@pytest.fixture()
+def serve(client):
+    """
+    Start amostra servers for the client's database, on background threads.
+
+    Call serve(**settings) to start one, with extra application settings,
+    and get its URL.
+    """
+    servers = []
+
+    def start(**settings):
+        sockets = netutil.bind_sockets(0, '127.0.0.1')
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            loop = ioloop.IOLoop.current()
+            app = Application(
+                init_handlers(),
+                mongo_client=amostra.mongo_client.Client(client._db),
+                executor=InstrumentedExecutor(4),
+                **settings)
+            http_server = httpserver.HTTPServer(app)
+            http_server.add_sockets(sockets)
+            servers.append((loop, thread))
+            started.set()
+            loop.start()
+            http_server.stop()
+            app.settings['executor'].shutdown()
+            loop.close(all_fds=True)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait()
+        host, port = sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    yield start
+    for loop, thread in servers:
+        loop.add_callback(loop.stop)
+        thread.join()
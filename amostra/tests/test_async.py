@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from jsonschema.exceptions import ValidationError
+
+import amostra.async_mongo_client
+
+
+def test_async_client(client):
+    async def exercise():
+        async_client = amostra.async_mongo_client.AsyncClient(
+            f'mongodb://localhost:27017/{client._db.name}')
+        samples = async_client.samples
+        a = await samples.new(name='a', tags=['x'])
+        await samples.new_many([{'name': 'b', 'tags': ['x', 'y']},
+                                {'name': 'c'}])
+        assert a.revision == 0
+        assert (await samples.find_one({'uuid': a.uuid})).name == 'a'
+        assert [s.name async for s in samples.find({'tags': 'x'},
+                                                   sort='name')] == ['a', 'b']
+        assert await samples.count() == 3
+        assert await samples.facets(['tags']) == {'tags': {'x': 2, 'y': 1}}
+
+        assert await samples.update(a.uuid, {'name': 'A'}) == 1
+        assert await samples.update(a.uuid, {'tags': []}) == 2
+        assert await samples.update('nope', {'name': 'z'}) is None
+        with pytest.raises(ValidationError):
+            await samples.update(a.uuid, {'name': 1})
+        with pytest.raises(ValueError):
+            await samples.update(a.uuid, {'revision': 7})
+        revisions = [(r.revision, r.name, r.tags)
+                     async for r in samples.revisions(a.uuid)]
+        assert revisions == [(1, 'A', ['x']), (0, 'a', ['x'])]
+        page = [r.revision async for r in samples.revisions(a.uuid, before=1)]
+        assert page == [0]
+        return a.uuid
+
+    uuid = asyncio.run(exercise())
+    # The synchronous client sees the same documents and revisions.
+    sample = client.samples.find_one({'uuid': uuid})
+    assert (sample.name, sample.revision) == ('A', 2)
+    assert [r.name for r in sample.revisions()] == ['A', 'a']
@@ -0,0 +1,19 @@
+import pytest
+from traitlets import TraitError
+
+
+def test_new_many(client):
+    samples = client.samples.new_many(
+        [{'name': f'sample {i}', 'tags': ['bulk']} for i in range(25)],
+        chunk_size=10)
+    assert [s.name for s in samples] == [f'sample {i}' for i in range(25)]
+    assert client._db.samples.count_documents({'tags': 'bulk'}) == 25
+    # The new objects are live.
+    samples[3].name = 'renamed'
+    assert client.samples.find_one({'uuid': samples[3].uuid}).revision == 1
+
+
+def test_new_many_validates_up_front(client):
+    with pytest.raises(TraitError):
+        client.samples.new_many([{'name': 'a'}, {'name': 1}])
+    assert client._db.samples.count_documents({}) == 0
@@ -0,0 +1,54 @@
+import gc
+
+import amostra.mongo_client
+import amostra.utils
+
+
+def test_cache(client):
+    client = amostra.mongo_client.Client(client._db, cache_size=2)
+    uuids = [client.samples.new(name=name).uuid for name in 'abc']
+    # Drop the live objects so that documents are hydrated from the cache.
+    gc.collect()
+    info = client.cache_info()
+    assert (info.evictions, info.currsize, info.maxsize) == (1, 2, 2)
+
+    assert client.samples.find_one({'uuid': uuids[2]}).name == 'c'
+    assert client.samples.find_one({'uuid': uuids[0]}).name == 'a'
+    info = client.cache_info()
+    assert (info.hits, info.misses, info.evictions) == (1, 1, 2)
+
+    # The client's own writes update the cache.
+    s = client.samples.find_one({'uuid': uuids[0]})
+    s.name = 'z'
+    del s
+    gc.collect()
+    assert client.samples.find_one({'uuid': uuids[0]}).name == 'z'
+    assert client.cache_info().hits == 3
+
+    # Changes by others are detected by checking the revision.
+    gc.collect()
+    client._db.samples.update_one({'uuid': uuids[0]},
+                                  {'$set': {'name': 'y'},
+                                   '$inc': {'revision': 1}})
+    assert client.samples.find_one({'uuid': uuids[0]}).name == 'y'
+    assert client.cache_info().misses == 2
+
+
+def test_ttl_cache(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(amostra.utils.time, 'monotonic', lambda: now[0])
+    cache = amostra.utils.TTLCache(10)
+    calls = []
+
+    def compute():
+        calls.append(now[0])
+        return len(calls)
+
+    assert cache.get('a', compute) == 1
+    now[0] += 9
+    assert cache.get('a', compute) == 1
+    assert cache.get('b', compute) == 2
+    now[0] += 2
+    # 'a' has expired, and is computed again.
+    assert cache.get('a', compute) == 3
+    assert cache.get('b', compute) == 2
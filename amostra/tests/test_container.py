@@ -0,0 +1,77 @@
+import amostra.mongo_client
+from amostra.objects import Container
+
+
+def test_lazy_contents(client, monkeypatch):
+    samples = [client.samples.new(name=f'sample {i}') for i in range(10)]
+    for i in range(3):
+        client.containers.new(
+            name=f'plate {i}', kind='plate',
+            contents={s: f'A{j}' for j, s in enumerate(samples)})
+
+    # Load them through a separate client, which does not have them already.
+    client = amostra.mongo_client.Client(client._db)
+    queries = []
+    find = client.samples.find
+
+    def counting_find(filter, *args, **kwargs):
+        queries.append(filter)
+        return find(filter, *args, **kwargs)
+
+    monkeypatch.setattr(client.samples, 'find', counting_find)
+    containers = list(client.containers.find({}))
+    assert len(containers) == 3
+    # Listing containers does not touch their contents.
+    assert [c.name for c in containers] == ['plate 0', 'plate 1', 'plate 2']
+    assert all(len(c.contents) == 10 for c in containers)
+    assert samples[0] in containers[0].contents
+    assert containers[0].contents[samples[0]] == 'A0'
+    assert not queries
+
+    # The contents of many containers can be fetched together.
+    Container.prefetch_contents(containers)
+    assert len(queries) == 1
+    expected = {s.uuid for s in samples}
+    for container in containers:
+        assert {s.uuid for s in container.contents} == expected
+    assert len(queries) == 1
+
+
+def test_contents_resolved_per_page(client, monkeypatch):
+    samples = [client.samples.new(name=f'sample {i}') for i in range(3)]
+    for i in range(5):
+        client.containers.new(name=f'plate {i}', kind='plate',
+                              contents={samples[i % 3]: 'A1'})
+    # Load them through a separate client, which does not have them already.
+    client = amostra.mongo_client.Client(client._db)
+    queries = []
+    find = client.samples.find
+
+    def counting_find(filter, *args, **kwargs):
+        queries.append(filter)
+        return find(filter, *args, **kwargs)
+
+    monkeypatch.setattr(client.samples, 'find', counting_find)
+    names = []
+    for container in client.containers.find({}, sort='name'):
+        sample, = container.contents
+        names.append(sample.name)
+    assert names == [f'sample {i % 3}' for i in range(5)]
+    # One query for the page of containers, not one per container
+    assert len(queries) == 1
+
+
+def test_contents_resolved_on_access(client):
+    s = client.samples.new(name='peanut butter')
+    c = client.containers.new(name='jar', kind='jar', contents={s: 'bottom'})
+    # Load it through a separate client, which does not have c already.
+    other_client = amostra.mongo_client.Client(client._db)
+    container = other_client.containers.find_one({'uuid': c.uuid})
+    assert not container.contents.resolved
+    sample, = container.contents
+    assert sample.uuid == s.uuid
+    assert container.contents.resolved
+    # Assigning a new dict syncs as before.
+    container.contents = {sample: 'top'}
+    assert client._db.containers.find_one({'uuid': c.uuid})['contents'] == {
+        s.uuid: 'top'}
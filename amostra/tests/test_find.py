@@ -0,0 +1,33 @@
+import pytest
+
+
+def test_sort_limit_skip(client):
+    client.samples.new_many([{'name': name} for name in 'dbeac'])
+    names = [s.name for s in client.samples.find({}, sort='name')]
+    assert names == list('abcde')
+    names = [s.name for s in client.samples.find({}, sort=[('name', -1)],
+                                                 skip=1, limit=2)]
+    assert names == list('dc')
+
+
+def test_count(client):
+    client.samples.new_many([{'name': name, 'tags': ['odd'] if i % 2 else []}
+                             for i, name in enumerate('dbeac')])
+    assert client.samples.count() == 5
+    assert client.samples.count({'tags': 'odd'}) == 2
+    assert client.samples.count(estimated=True) == 5
+    with pytest.raises(ValueError):
+        client.samples.count({'tags': 'odd'}, estimated=True)
+
+
+def test_distinct_and_facets(client):
+    client.samples.new_many([{'name': 'a', 'tags': ['x', 'y']},
+                             {'name': 'b', 'tags': ['x']},
+                             {'name': 'c', 'tags': [], 'projects': ['p']}])
+    assert sorted(client.samples.distinct('tags')) == ['x', 'y']
+    assert client.samples.distinct('tags', {'name': 'b'}) == ['x']
+    facets = client.samples.facets(['tags', 'projects'])
+    assert facets == {'tags': {'x': 2, 'y': 1}, 'projects': {'p': 1}}
+    assert list(facets['tags']) == ['x', 'y']
+    facets = client.samples.facets(['tags'], {'name': {'$ne': 'a'}})
+    assert facets == {'tags': {'x': 1}}
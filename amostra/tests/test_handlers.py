@@ -0,0 +1,100 @@
+import pytest
+from tornado import web
+
+from amostra.handlers import (
+    _decode_continuation,
+    _encode_continuation,
+    _keyset_filter,
+    _page,
+    _page_query,
+)
+
+
+def test_page_query():
+    query, page_size = _page_query({'filter': {}, 'sort': 'name',
+                                    'fields': ['name', 'tags'],
+                                    'page_size': 5, 'skip': 2})
+    assert page_size == 5
+    assert query == {'filter': {}, 'fields': ['name', 'tags', 'uuid'],
+                     'sort': [('name', 1), ('uuid', 1)], 'limit': 6,
+                     'skip': 2}
+
+    token = _encode_continuation(['b', 'u'])
+    query, page_size = _page_query({'filter': {'tags': 'x'}, 'limit': 3,
+                                    'sort': [['name', -1]], 'skip': 2,
+                                    'continuation': token})
+    assert page_size == 3
+    assert query['filter'] == {'$and': [{'tags': 'x'},
+                                        _keyset_filter(query['sort'],
+                                                       ['b', 'u'])]}
+    assert query['skip'] is None  # The skip was applied on the first page.
+
+
+def test_keyset_filter():
+    keys = [('name', 1), ('uuid', 1)]
+    assert _keyset_filter(keys, ['b', 'u']) == {'$or': [
+        {'name': {'$gt': 'b'}},
+        {'name': 'b', 'uuid': {'$gt': 'u'}}]}
+    # Everything with a name sorts after null.
+    assert _keyset_filter(keys, [None, 'u']) == {'$or': [
+        {'name': {'$ne': None}},
+        {'name': None, 'uuid': {'$gt': 'u'}}]}
+    keys = [('name', -1), ('uuid', 1)]
+    # Null sorts last in descending order.
+    assert _keyset_filter(keys, ['b', 'u']) == {'$or': [
+        {'$or': [{'name': {'$lt': 'b'}}, {'name': None}]},
+        {'name': 'b', 'uuid': {'$gt': 'u'}}]}
+    assert _keyset_filter(keys, [None, 'u']) == {'$or': [
+        {'name': None, 'uuid': {'$gt': 'u'}}]}
+
+
+def test_decode_continuation():
+    token = _encode_continuation(['b', None, 1])
+    assert _decode_continuation(token, 3) == ['b', None, 1]
+    for token in ('not base64!', _encode_continuation({'a': 1}),
+                  _encode_continuation(['b', None]),
+                  _encode_continuation([['x'], None, 1])):
+        with pytest.raises(web.HTTPError) as excinfo:
+            _decode_continuation(token, 3)
+        assert excinfo.value.status_code == 400
+
+
+def test_page():
+    keys = [('name', 1), ('uuid', 1)]
+    results = [{'uuid': 'u1', 'revision': 0, 'name': 'a', 'tags': []},
+               {'uuid': 'u2', 'revision': 0, 'name': 'b', 'tags': []}]
+    page = _page(keys, 1, results, ['tags'])
+    # The sort key is used for the token but not returned.
+    assert page['results'] == [{'uuid': 'u1', 'revision': 0, 'tags': []}]
+    assert _decode_continuation(page['continuation'], 2) == ['a', 'u1']
+    assert _page(keys, 2, results) == {'results': results,
+                                       'continuation': None}
+    # Results sorted by a list can come in one page, but not be paged.
+    keys = [('tags', 1), ('uuid', 1)]
+    assert _page(keys, 2, results)['results'] == results
+    with pytest.raises(web.HTTPError) as excinfo:
+        _page(keys, 1, results)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize('direction', [1, -1])
+def test_pages_with_missing_values(client, direction):
+    client.samples.new_many([{'name': f'{i}', 'description': f'{i % 3}'}
+                             for i in range(6)])
+    client.samples.new_many([{'name': f'{i}', 'projects': ['x']}
+                             for i in range(6, 10)])
+    client._db.samples.update_many({'projects': 'x'},
+                                   {'$unset': {'description': ''}})
+    body = {'filter': {}, 'sort': [['description', direction]],
+            'fields': ['name'], 'page_size': 3}
+    names = []
+    while True:
+        query, page_size = _page_query(body)
+        results = [record.to_dict() for record in
+                   client.samples.find(readonly=True, **query)]
+        page = _page(query['sort'], page_size, results, body['fields'])
+        names.extend(result['name'] for result in page['results'])
+        if page['continuation'] is None:
+            break
+        body['continuation'] = page['continuation']
+    assert sorted(names, key=int) == [f'{i}' for i in range(10)]
@@ -0,0 +1,166 @@
+import pytest
+from tornado import web
+
+import amostra.handlers
+import amostra.http_client
+from amostra.utils import TTLCache
+
+
+@pytest.fixture()
+def http_client(serve):
+    return amostra.http_client.Client(serve())
+
+
+def count_requests(http_client):
+    "Record the URL of each request the client makes."
+    urls = []
+    http_client._session.hooks['response'].append(
+        lambda response, *args, **kwargs: urls.append(response.url))
+    return urls
+
+
+def test_new_many(client, http_client):
+    urls = count_requests(http_client)
+    samples = http_client.samples.new_many(
+        [{'name': f'sample {i}', 'tags': ['bulk']} for i in range(25)],
+        chunk_size=10)
+    # One request per chunk
+    assert len(urls) == 3
+    assert all(url.endswith('/samples/bulk') for url in urls)
+    assert [s.name for s in samples] == [f'sample {i}' for i in range(25)]
+    # The objects have the uuids the server gave them.
+    for s in samples:
+        stored = client._db.samples.find_one({'uuid': s.uuid})
+        assert (stored['name'], stored['revision']) == (s.name, 0)
+    assert client._db.samples.count_documents({'tags': 'bulk'}) == 25
+    assert len({s.uuid for s in samples}) == 25
+    # The new objects are live.
+    assert http_client.samples.find_one({'uuid': samples[3].uuid}) is samples[3]
+    samples[3].name = 'renamed'
+    assert samples[3].revision == 1
+    assert client._db.samples.find_one({'uuid': samples[3].uuid})['name'] == (
+        'renamed')
+
+
+def test_find_one_fields(client, http_client):
+    s = http_client.samples.new(name='peanut butter', description='x' * 1000)
+    urls = count_requests(http_client)
+    record = http_client.samples.find_one({'uuid': s.uuid}, fields=['name'])
+    assert record.to_dict() == {'uuid': s.uuid, 'revision': 0,
+                                'name': 'peanut butter'}
+    # This is a search, not a GET of the whole document.
+    assert [url.rstrip('/').rsplit('/', 1)[-1] for url in urls] == ['samples']
+    assert http_client.samples.find_one({'uuid': 'nope'},
+                                        fields=['name']) is None
+
+
+def test_sort_by_list_field(http_client):
+    http_client.samples.new_many([{'name': f'{i}', 'tags': [f'{9 - i}']}
+                                  for i in range(9)])
+    names = [s.name for s in http_client.samples.find({}, sort='tags')]
+    assert names == [f'{i}' for i in reversed(range(9))]
+
+
+@pytest.fixture()
+def flushes(monkeypatch):
+    "Stream in batches of 10 and record the size of each streamed flush."
+    monkeypatch.setattr(amostra.handlers, 'FLUSH_INTERVAL', 10)
+    sizes = []
+    flush = web.RequestHandler.flush
+
+    def counting_flush(self, *args, **kwargs):
+        if self._headers.get('Content-Type') == amostra.handlers.NDJSON:
+            sizes.append(sum(len(chunk) for chunk in self._write_buffer))
+        return flush(self, *args, **kwargs)
+
+    monkeypatch.setattr(web.RequestHandler, 'flush', counting_flush)
+    return sizes
+
+
+def test_stream_search(http_client, flushes):
+    http_client.samples.new_many([{'name': f'{i:03}', 'tags': ['a']}
+                                  for i in range(250)])
+    samples = list(http_client.samples.find({'tags': 'a'}, sort='name',
+                                            stream=True))
+    assert [s.name for s in samples] == [f'{i:03}' for i in range(250)]
+    # The response was written in 25 batches of 10 documents as they were
+    # read, not all at once.
+    assert len([size for size in flushes if size]) == 25
+    records = list(http_client.samples.find({}, fields=['name'], sort='name',
+                                            limit=15, skip=5, stream=True))
+    assert [r.to_dict() for r in records] == [
+        {'uuid': s.uuid, 'revision': 0, 'name': s.name}
+        for s in samples[5:20]]
+    # The results are live objects.
+    samples[0].name = 'renamed'
+    assert samples[0].revision == 1
+
+
+def test_stream_revisions(http_client, flushes):
+    s = http_client.samples.new(name='0')
+    for i in range(1, 26):
+        s.name = f'{i}'
+    response = http_client._session.get(
+        http_client._make_url('samples', s.uuid, 'revisions'),
+        headers={'Accept': amostra.http_client.NDJSON}, stream=True)
+    response.raise_for_status()
+    assert response.headers['Content-Type'] == amostra.http_client.NDJSON
+    pages = list(amostra.http_client._ndjson_pages(response, page_size=10))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [(document['revision'], document['name'])
+            for page in pages for document in page] == [
+        (i, f'{i}') for i in reversed(range(25))]
+    assert len([size for size in flushes if size]) == 3
+
+
+def test_count(http_client):
+    http_client.samples.new_many([{'name': f'{i}', 'tags': ['even']}
+                                  for i in range(0, 10, 2)])
+    http_client.samples.new_many([{'name': f'{i}'} for i in range(1, 10, 2)])
+    assert http_client.samples.count() == 10
+    assert http_client.samples.count({'tags': 'even'}) == 5
+    assert http_client.samples.count(estimated=True) == 10
+    assert http_client.containers.count() == 0
+    with pytest.raises(ValueError):
+        http_client.samples.count({'tags': 'even'}, estimated=True)
+    # The server rejects this too.
+    response = http_client._session.post(
+        http_client._make_url('samples', 'count'),
+        json={'filter': {'tags': 'even'}, 'estimated': True})
+    assert response.status_code == 400
+
+
+def test_distinct_and_facets(http_client):
+    http_client.samples.new_many([{'name': 'a', 'tags': ['x', 'y']},
+                                  {'name': 'b', 'tags': ['x']},
+                                  {'name': 'c', 'tags': [], 'projects': ['p']}])
+    assert sorted(http_client.samples.distinct('tags')) == ['x', 'y']
+    assert http_client.samples.distinct('tags', {'name': 'b'}) == ['x']
+    facets = http_client.samples.facets(['tags', 'projects'])
+    assert facets == {'tags': {'x': 2, 'y': 1}, 'projects': {'p': 1}}
+    assert list(facets['tags']) == ['x', 'y']
+    facets = http_client.samples.facets(['tags'], {'name': {'$ne': 'a'}})
+    assert facets == {'tags': {'x': 1}}
+    http_client.containers.new(name='a', kind='box', contents={})
+    assert http_client.containers.facets(['kind']) == {'kind': {'box': 1}}
+
+
+def test_cached_aggregations(serve, http_client):
+    cached = amostra.http_client.Client(
+        serve(aggregation_cache=TTLCache(60)))
+    cached.samples.new_many([{'name': 'a', 'tags': ['x']},
+                             {'name': 'b', 'tags': ['y']}])
+    assert cached.samples.facets(['tags']) == {'tags': {'x': 1, 'y': 1}}
+    assert sorted(cached.samples.distinct('tags')) == ['x', 'y']
+    cached.samples.new(name='c', tags=['x', 'z'])
+    # Within the TTL, the same queries are answered from the cache.
+    assert cached.samples.facets(['tags']) == {'tags': {'x': 1, 'y': 1}}
+    assert sorted(cached.samples.distinct('tags')) == ['x', 'y']
+    # Other queries are not.
+    assert cached.samples.facets(['tags'], {}) == {
+        'tags': {'x': 2, 'y': 1, 'z': 1}}
+    assert cached.samples.facets(['tags'], {'name': 'c'}) == {
+        'tags': {'x': 1, 'z': 1}}
+    # A server without the cache sees the new document at once.
+    assert http_client.samples.facets(['tags']) == {
+        'tags': {'x': 2, 'y': 1, 'z': 1}}
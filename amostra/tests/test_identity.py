@@ -0,0 +1,56 @@
+import gc
+
+import amostra.http_client
+import amostra.mongo_client
+
+
+def test_one_live_object_per_uuid(client):
+    s = client.samples.new(name='peanut butter')
+    assert client.samples.find_one({'uuid': s.uuid}) is s
+    s.name = 'jelly'
+    assert client.samples.find_one({'uuid': s.uuid}) is s
+    assert next(client.samples.find({'name': 'jelly'})) is s
+
+    # Older revisions are separate objects.
+    revision, = s.revisions()
+    assert revision is not s
+    assert client.samples.find_one({'uuid': s.uuid}) is s
+
+    # Samples are shared by the containers that hold them.
+    a = client.containers.new(name='a', kind='box', contents={s: 'left'})
+    b = client.containers.new(name='b', kind='box', contents={s: 'right'})
+    a = client.containers.find_one({'uuid': a.uuid})
+    b = client.containers.find_one({'uuid': b.uuid})
+    assert list(a.contents) == list(b.contents) == [s]
+
+
+def test_identity_map_does_not_keep_objects_alive(client):
+    uuid = client.samples.new(name='peanut butter').uuid
+    gc.collect()
+    assert not client._identity_map
+    assert client.samples.find_one({'uuid': uuid}).name == 'peanut butter'
+
+
+def test_live_object_catches_up_with_other_writers(client):
+    s = client.samples.new(name='a', description='x')
+    other = amostra.mongo_client.Client(client._db)
+    other.samples.find_one({'uuid': s.uuid}).description = 'y'
+    s.name = 'b'
+    assert (s.revision, s.name, s.description) == (2, 'b', 'y')
+    assert client.samples.find_one({'uuid': s.uuid}) is s
+    stored = client._db.samples.find_one({'uuid': s.uuid})
+    assert (stored['revision'], stored['name'], stored['description']) == (
+        2, 'b', 'y')
+
+
+def test_http_live_object_catches_up_with_other_writers(client, serve):
+    url = serve()
+    first = amostra.http_client.Client(url)
+    second = amostra.http_client.Client(url)
+    s = first.samples.new(name='a', description='x')
+    second.samples.find_one({'uuid': s.uuid}).description = 'y'
+    s.name = 'b'
+    assert (s.revision, s.name, s.description) == (2, 'b', 'y')
+    found = first.samples.find_one({'uuid': s.uuid})
+    assert found is s
+    assert found.description == 'y'
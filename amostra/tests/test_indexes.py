@@ -0,0 +1,29 @@
+def _stages(plan):
+    "Collect the stage names in a query plan, which is a nested dict."
+    stages = []
+    while plan:
+        stages.append(plan['stage'])
+        plan = plan.get('inputStage')
+    return stages
+
+
+def test_indexes(client):
+    client.ensure_indexes()
+    client.ensure_indexes()  # idempotent
+    s = client.samples.new(name='a', tags=['t'])
+    s.name = 'b'
+    s.name = 'c'
+
+    def winning_plan(cursor):
+        return _stages(cursor.explain()['queryPlanner']['winningPlan'])
+
+    stages = winning_plan(client._db.samples.find({'uuid': s.uuid}))
+    assert any('IXSCAN' in stage for stage in stages)
+    stages = winning_plan(client._db.samples.find({'tags': 't'}))
+    assert any('IXSCAN' in stage for stage in stages)
+    stages = winning_plan(
+        client._db.samples_revisions.find({'uuid': s.uuid})
+                                    .sort('revision', -1))
+    assert any('IXSCAN' in stage for stage in stages)
+    # The index provides the order, so no in-memory sort is needed.
+    assert 'SORT' not in stages
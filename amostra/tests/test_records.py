@@ -0,0 +1,41 @@
+import pytest
+
+from amostra.objects import Record, Sample
+
+
+def test_readonly_find(client):
+    s = client.samples.new(name='peanut butter', tags=['a'])
+    record, = client.samples.find({'name': 'peanut butter'}, readonly=True)
+    assert isinstance(record, Record)
+    assert record.to_dict() == s.to_dict()
+    with pytest.raises(AttributeError):
+        record.name = 'jelly'
+
+    # Promote to a live object and edit it.
+    live = record.promote()
+    assert isinstance(live, Sample)
+    live.name = 'jelly'
+    assert client.samples.find_one({'uuid': s.uuid}).name == 'jelly'
+    # The record is a snapshot and is unaffected.
+    assert record.name == 'peanut butter'
+
+
+def test_find_fields(client):
+    s = client.samples.new(name='peanut butter', description='x' * 1000)
+    record, = client.samples.find({}, fields=['name'])
+    assert isinstance(record, Record)
+    assert record.to_dict() == {'uuid': s.uuid, 'revision': 0,
+                                'name': 'peanut butter'}
+    with pytest.raises(AttributeError):
+        record.description
+    # Promoting a partial record fetches the full document.
+    assert record.promote().description == 'x' * 1000
+
+
+def test_find_one_fields(client):
+    s = client.samples.new(name='peanut butter', description='x' * 1000)
+    record = client.samples.find_one({'uuid': s.uuid}, fields=['name'])
+    assert isinstance(record, Record)
+    assert record.to_dict() == {'uuid': s.uuid, 'revision': 0,
+                                'name': 'peanut butter'}
+    assert client.samples.find_one({'name': 'jelly'}, fields=['name']) is None
@@ -4,6 +4,8 @@ import string
 from hypothesis import given, settings
 from hypothesis import strategies as st
 
+import amostra.mongo_client
+
 
 @given(names=st.lists(st.text(alphabet=string.ascii_lowercase,
                               min_size=1, max_size=4),
@@ -21,9 +23,81 @@ def test_revert(client, names):
     revert_target_cursor = client._db.samples_revisions.find({'revision': num,
                                                               'uuid': uuid})
     s.revert(num)
+    # Reverting makes exactly one new revision.
+    assert s.revision == n
+    assert client.samples.find_one({'uuid': uuid}).revision == n
     target = next(revert_target_cursor)
     for name in s.trait_names():
         if name == 'revision':
             continue
         else:
             assert getattr(s, name) == target[name]
+
+
+def test_delta_revisions(client):
+    client = amostra.mongo_client.Client(client._db, revision_storage='delta',
+                                         snapshot_interval=3)
+    s = client.samples.new(name='a', tags=['x'], description='long' * 100)
+    names = ['b', 'c', 'd', 'e', 'f', 'g', 'h']
+    for name in names:
+        s.name = name
+    s.tags = ['y']
+    # Only full copies carry unchanged fields such as description.
+    stored = list(client._db.samples_revisions.find({'uuid': s.uuid}))
+    assert [d['revision'] for d in stored if '_delta' not in d] == [0, 3, 6]
+    deltas = {d['revision']: d['_delta'] for d in stored if '_delta' in d}
+    assert deltas == {1: {'name': 'b'}, 2: {'name': 'c'}, 4: {'name': 'e'},
+                      5: {'name': 'f'}, 7: {'tags': ['x']}}
+
+    revisions = list(s.revisions())
+    assert [r.revision for r in revisions] == list(range(8))[::-1]
+    assert [r.name for r in revisions] == ['h'] + names[::-1][1:] + ['a']
+    assert all(r.tags == ['x'] and r.description == 'long' * 100
+               for r in revisions)
+
+    for num in (4, 0):
+        s.revert(num)
+        expected = {'name': (['a'] + names)[num], 'tags': ['x']}
+        assert {'name': s.name, 'tags': s.tags} == expected
+        assert client.samples.find_one({'uuid': s.uuid}).name == s.name
+
+
+def test_revisions_pages(client):
+    client = amostra.mongo_client.Client(client._db, revision_storage='delta',
+                                         snapshot_interval=3)
+    s = client.samples.new(name='a')
+    for name in 'bcdefgh':
+        s.name = name
+    everything = [(r.revision, r.name) for r in s.revisions()]
+    pages = []
+    before = None
+    while True:
+        page = [(r.revision, r.name)
+                for r in client._revisions(s, before=before, limit=3)]
+        if not page:
+            break
+        pages.append(page)
+        before = page[-1][0]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == everything
+
+
+def test_delta_revisions_two_writers(client):
+    first, second = (
+        amostra.mongo_client.Client(client._db, revision_storage='delta',
+                                    snapshot_interval=2)
+        for _ in range(2))
+    s = first.samples.new(name='a', description='x')
+    other = second.samples.find_one({'uuid': s.uuid})
+    s.name = 'b'  # revision 1
+    # other still has revision 0, so it does not know that revision 1 is
+    # not stored in full, but revision 2 is.
+    other.description = 'y'
+    s.name = 'c'
+    assert (s.revision, other.revision) == (3, 2)
+    stored = {d['revision']: d for d in
+              client._db.samples_revisions.find({'uuid': s.uuid})}
+    assert stored[2]['name'] == 'b' and '_delta' not in stored[2]
+    revisions = [(r.revision, r.name, r.description) for r in s.revisions()]
+    assert revisions == [(2, 'b', 'y'), (1, 'b', 'x'), (0, 'a', 'x')]
+    assert client._db.samples.find_one({'uuid': s.uuid})['description'] == 'y'
@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import os
+import signal
+
+import pytest
+from tornado import httpclient, httpserver, ioloop, netutil, web
+
+from amostra.server import RESTART_STATUS, Application, GracefulShutdown, fork_workers
+
+
+def run_workers(monkeypatch, statuses, max_restarts):
+    """
+    Run fork_workers in the parent process, with workers exiting with the
+    given wait() statuses, one after another.
+
+    Return how it ended, SystemExit or RuntimeError, and the number of forks.
+    """
+    pids = itertools.count(1000)
+    forked = {}
+
+    def fork():
+        pid = next(pids)
+        forked[pid] = len(forked)
+        return pid
+
+    statuses = iter(statuses)
+
+    def wait():
+        # The oldest worker that is still running exits.
+        pid = min(pid for pid in forked if pid not in exited)
+        exited.add(pid)
+        return pid, next(statuses)
+
+    exited = set()
+    monkeypatch.setattr(os, 'fork', fork)
+    monkeypatch.setattr(os, 'wait', wait)
+    with pytest.raises((SystemExit, RuntimeError)) as excinfo:
+        fork_workers(2, max_restarts)
+    return excinfo.value, len(forked)
+
+
+def exited(status):
+    "Encode an exit status as os.wait() reports it."
+    return status << 8
+
+
+def test_fork_workers(monkeypatch):
+    # Restarts on request do not count toward max_restarts.
+    result, forks = run_workers(
+        monkeypatch, [exited(RESTART_STATUS)] * 5 + [exited(0)] * 2,
+        max_restarts=0)
+    assert isinstance(result, SystemExit) and result.code == 0
+    assert forks == 7
+    # Failures do.
+    result, forks = run_workers(
+        monkeypatch, [exited(1), signal.SIGKILL, exited(RESTART_STATUS),
+                      exited(1)],
+        max_restarts=2)
+    assert isinstance(result, RuntimeError)
+    assert forks == 5
+
+
+def test_fork_workers_returns_task_id_in_worker(monkeypatch):
+    monkeypatch.setattr(os, 'fork', lambda: 0)
+    assert fork_workers(3, 0) == 0
+
+
+def run_loop(scenario):
+    "Run a coroutine function on a new IOLoop until something stops it."
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    loop = ioloop.IOLoop.current()
+    try:
+        future = asyncio.ensure_future(scenario())
+        # Stop at once if the scenario fails.
+        future.add_done_callback(
+            lambda future: future.exception() and loop.stop())
+        loop.start()
+        return future.result()
+    finally:
+        loop.close(all_fds=True)
+        asyncio.set_event_loop(None)
+
+
+def test_graceful_shutdown():
+    finished = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        class SlowHandler(web.RequestHandler):
+            async def get(self):
+                await release.wait()
+                self.write('done')
+                finished.append(True)
+
+        app = Application([(r'/slow', SlowHandler)])
+        sockets = netutil.bind_sockets(0, '127.0.0.1')
+        port = sockets[0].getsockname()[1]
+        http_server = httpserver.HTTPServer(app)
+        http_server.add_sockets(sockets)
+        shutdown = GracefulShutdown(http_server, app, shutdown_timeout=5,
+                                    restart=True)
+        # An idle connection is not a request in flight.
+        _, writer = await asyncio.open_connection('127.0.0.1', port)
+        await asyncio.sleep(0.05)
+        assert app.in_flight == 0
+        asyncio.ensure_future(httpclient.AsyncHTTPClient().fetch(
+            f'http://127.0.0.1:{port}/slow'))
+        while not app.in_flight:
+            await asyncio.sleep(0.01)
+        assert app.in_flight == 1
+
+        shutdown._on_signal(RESTART_STATUS)
+        await asyncio.sleep(0.05)
+        # New connections are refused, but the request in flight goes on.
+        with pytest.raises(OSError):
+            await asyncio.open_connection('127.0.0.1', port)
+        assert not finished
+        release.set()
+        writer.close()
+        return shutdown
+
+    shutdown = run_loop(scenario)
+    # The loop stopped once the request in flight finished.
+    assert finished == [True]
+    assert shutdown.app.in_flight == 0
+    assert shutdown.exit_status == RESTART_STATUS
+
+
+def test_graceful_shutdown_of_orphan(monkeypatch):
+    async def scenario():
+        app = Application([])
+        http_server = httpserver.HTTPServer(app)
+        http_server.add_sockets(netutil.bind_sockets(0, '127.0.0.1'))
+        shutdown = GracefulShutdown(http_server, app, shutdown_timeout=5,
+                                    restart=True)
+        shutdown._check_parent()
+        assert not shutdown._stopping
+        # The parent process has exited, so this process was adopted.
+        monkeypatch.setattr(os, 'getppid', lambda: shutdown._parent_pid + 1)
+        shutdown._check_parent()
+        return shutdown
+
+    shutdown = run_loop(scenario)
+    assert shutdown.exit_status == 0
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from jsonschema.exceptions import ValidationError
+
+import amostra.mongo_client
+
+
+def test_update_makes_one_revision(client):
+    s = client.samples.new(name='peanut butter')
+    s.update(name='jelly', tags=['sweet'], description='grape')
+    assert s.revision == 1
+    assert client._db.samples_revisions.count_documents({'uuid': s.uuid}) == 1
+    stored = client.samples.find_one({'uuid': s.uuid})
+    assert stored.to_dict() == s.to_dict()
+
+    with pytest.raises(AttributeError):
+        s.update(color='purple')
+
+
+def test_transaction(client):
+    s = client.samples.new(name='peanut butter')
+    with s.transaction():
+        s.name = 'jelly'
+        s.name = 'grape jelly'
+        s.tags = ['sweet']
+    assert s.revision == 1
+    revision, = s.revisions()
+    assert revision.name == 'peanut butter'
+
+    # Changes are rolled back and not synced if the block raises.
+    with pytest.raises(RuntimeError):
+        with s.transaction():
+            s.name = 'marmalade'
+            raise RuntimeError
+    assert s.name == 'grape jelly'
+    assert s.revision == 1
+    assert client.samples.find_one({'uuid': s.uuid}).name == 'grape jelly'
+
+
+def test_update_many(client):
+    live = client.samples.new(name='a', projects=['x'])
+    client.samples.new_many([{'name': f'{i}', 'projects': ['x']}
+                             for i in range(9)])
+    client.samples.new(name='other', projects=['y'])
+    count = client.samples.update_many({'projects': 'x'}, {'tags': ['xray']},
+                                       batch_size=4)
+    assert count == 10
+    assert client._db.samples.count_documents({'tags': 'xray'}) == 10
+    assert client._db.samples.count_documents({'revision': 1}) == 10
+    assert client._db.samples_revisions.count_documents({}) == 10
+    # Live objects are brought up to date.
+    assert live.tags == ['xray']
+    assert live.revision == 1
+    revision, = live.revisions()
+    assert revision.tags == []
+
+    with pytest.raises(ValueError):
+        client.samples.update_many({}, {'revision': 5})
+
+
+def test_update_many_concurrent_change(client, monkeypatch):
+    a = client.samples.new(name='a', projects=['x'])
+    b = client.samples.new(name='b', projects=['x'])
+    other = amostra.mongo_client.Client(client._db)
+    collection_type = type(client._db.samples)
+    bulk_write = collection_type.bulk_write
+    calls = []
+
+    def change_first(self, *args, **kwargs):
+        # Someone else changes a between our read and our update.
+        if not calls:
+            other.samples.find_one({'uuid': a.uuid}).name = 'changed'
+        calls.append(args)
+        return bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, 'bulk_write', change_first)
+    count = client.samples.update_many({'projects': 'x'}, {'tags': ['xray']})
+    assert count == 2
+    # One bulk write for the batch, and one to retry the conflict
+    assert len(calls) == 2
+    assert client._db.samples.count_documents({}) == 2
+    stored = client._db.samples.find_one({'uuid': a.uuid})
+    assert (stored['revision'], stored['name']) == (2, 'changed')
+    assert stored['tags'] == ['xray']
+    assert [(r.revision, r.name, r.tags) for r in a.revisions()] == [
+        (1, 'changed', []), (0, 'a', [])]
+    stored = client._db.samples.find_one({'uuid': b.uuid})
+    assert (stored['revision'], stored['tags']) == (1, ['xray'])
+    assert [(r.revision, r.name) for r in b.revisions()] == [(0, 'b')]
+
+
+def test_update_from_threads(client):
+    s = client.samples.new(name='a')
+    n = 20
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(
+            lambda i: client.samples.update(s.uuid, {'name': f'{i}'}),
+            range(n)))
+    # Each update made its own revision.
+    assert sorted(results) == list(range(1, n + 1))
+    assert client._db.samples.find_one({'uuid': s.uuid})['revision'] == n
+    stored = [r['revision'] for r in
+              client._db.samples_revisions.find({'uuid': s.uuid})]
+    assert sorted(stored) == list(range(n))
+
+    with ThreadPoolExecutor(8) as executor:
+        documents = list(executor.map(
+            lambda i: client._revert_document(type(s), s.uuid, 0),
+            range(n)))
+    assert sorted(d['revision'] for d in documents) == list(
+        range(n + 1, 2 * n + 1))
+    assert {d['name'] for d in documents} == {'a'}
+
+    assert client.samples.update('nope', {'name': 'b'}) is None
+    with pytest.raises(ValidationError):
+        client.samples.update(s.uuid, {'name': 1})
+    with pytest.raises(ValueError):
+        client.samples.update(s.uuid, {'revision': 7})
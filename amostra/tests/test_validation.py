@@ -0,0 +1,26 @@
+import jsonschema
+import pytest
+
+from amostra.objects import Container, Sample, _validate_with_jsonschema
+
+
+@pytest.mark.parametrize('obj_type, kwargs',
+                         [(Sample, {'name': 'a'}),
+                          (Container, {'name': 'a', 'kind': 'b',
+                                       'contents': {}})])
+def test_validators_set_up_per_class(obj_type, kwargs):
+    validator = obj_type._validator
+    obj = obj_type(None, **kwargs)
+    # Every trait is validated against the schema...
+    assert set(obj._trait_validators) == set(obj.trait_names())
+    # ...using the validator compiled when the class was defined.
+    assert obj_type._validator is validator
+
+
+def test_changed_field_validation():
+    s = Sample(None, name='a')
+    proposal = {'trait': s.traits()['tags'], 'value': [1], 'owner': s}
+    with pytest.raises(jsonschema.ValidationError):
+        _validate_with_jsonschema(s, proposal)
+    proposal['value'] = ['b']
+    assert _validate_with_jsonschema(s, proposal) == ['b']
@@ -1,5 +1,8 @@
+import concurrent.futures
 import json
 import os
+import threading
+import time
 
 import pkg_resources
 
@@ -37,3 +40,106 @@ def url_path_join(*pieces):
         result = '/'
 
     return result
+
+
+def normalize_sort(sort):
+    """
+    Convert a sort specification to a list of (field, direction) pairs.
+
+    This accepts None, a field name (sorted in ascending order), or a list of
+    pairs, which may have arrived as JSON lists.
+    """
+    if sort is None:
+        return None
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    return [(field, int(direction)) for field, direction in sort]
+
+
+class TTLCache:
+    """
+    A thread-safe cache whose entries expire after a fixed number of seconds.
+    """
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._entries = {}  # maps key to (expiry time, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Return the cached value for key, or compute and cache it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        value = compute()
+        with self._lock:
+            # Drop expired entries so that the cache does not grow without
+            # bound.
+            self._entries = {k: v for k, v in self._entries.items()
+                             if v[0] > now}
+            self._entries[key] = (now + self._ttl, value)
+        return value
+
+
+class InstrumentedExecutor(concurrent.futures.ThreadPoolExecutor):
+    """
+    A thread pool that keeps statistics on how busy it is.
+
+    Tasks are queued until a thread is free. See :meth:`metrics`.
+    """
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers,
+                         thread_name_prefix='amostra')
+        self._metrics_lock = threading.Lock()
+        self._queued = self._running = self._completed = 0
+        self._wait_seconds = self._run_seconds = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.monotonic()
+
+        def run():
+            started = time.monotonic()
+            with self._metrics_lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_seconds += started - submitted
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._metrics_lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._run_seconds += time.monotonic() - started
+
+        with self._metrics_lock:
+            self._queued += 1
+        try:
+            return super().submit(run)
+        except RuntimeError:
+            # The executor has been shut down.
+            with self._metrics_lock:
+                self._queued -= 1
+            raise
+
+    def metrics(self):
+        """
+        Report the current load and the totals since the executor started.
+
+        Returns
+        -------
+        metrics: dict
+            max_workers, queued (tasks waiting for a thread), running,
+            completed, wait_seconds (total time that completed and running
+            tasks spent queued), and run_seconds (total time that completed
+            tasks spent running)
+        """
+        with self._metrics_lock:
+            return {'max_workers': self._max_workers,
+                    'queued': self._queued,
+                    'running': self._running,
+                    'completed': self._completed,
+                    'wait_seconds': self._wait_seconds,
+                    'run_seconds': self._run_seconds}
@@ -0,0 +1,44 @@
+"""
+Measure how fast search results are converted into objects.
+
+Run with ``python benchmarks/hydration.py [MONGO_URI]``. A scratch database
+is created on the MongoDB server (localhost by default) and dropped at the
+end.
+"""
+import sys
+import time
+import uuid
+
+import pymongo
+
+import amostra.mongo_client
+
+SIZES = (10_000, 100_000)
+
+
+def main(url='mongodb://localhost:27017/'):
+    db_name = str(uuid.uuid4())
+    client = amostra.mongo_client.Client(url + db_name)
+    try:
+        inserted = 0
+        for size in SIZES:
+            # Insert the raw documents directly; only hydration is measured.
+            client._db.samples.insert_many(
+                [{'uuid': str(uuid.uuid4()), 'revision': 0,
+                  'name': f'sample {i}', 'projects': [], 'composition': '',
+                  'tags': ['a', 'b'], 'description': ''}
+                 for i in range(inserted, size)])
+            inserted = size
+            for readonly in (False, True):
+                start = time.perf_counter()
+                count = sum(1 for _ in client.samples.find({}, readonly))
+                duration = time.perf_counter() - start
+                kind = 'SampleRecords' if readonly else 'Samples'
+                print(f'find() hydrated {count:>7} {kind:<13} in '
+                      f'{duration:6.2f} s ({count / duration:8.0f} per second)')
+    finally:
+        pymongo.MongoClient(url).drop_database(db_name)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,44 @@
+"""
+Measure the cost of validating a document against its jsonschema.
+
+Run with ``python benchmarks/validation.py``. No database is required.
+"""
+import timeit
+
+import jsonschema
+
+from amostra.objects import Container, Sample, _validate_with_jsonschema
+
+NUMBER = 2000
+
+
+def report(label, seconds):
+    print(f'{label:<50} {1e6 * seconds / NUMBER:8.1f} us per call')
+
+
+def main():
+    sample = Sample(None, name='peanut butter', tags=['a', 'b', 'c'],
+                    description='x' * 1000)
+    contents = {Sample(None, name=f'sample {i}'): f'A{i}' for i in range(1000)}
+    container = Container(None, name='plate', kind='96-well',
+                          contents=contents)
+    for obj in (sample, container):
+        name = f'{type(obj).__name__}'
+        proposal = {'trait': obj.traits()['name'], 'value': 'jelly',
+                    'owner': obj}
+        report(f'{name}: jsonschema.validate (uncompiled)',
+               timeit.timeit(
+                   lambda: jsonschema.validate(obj.to_dict(), obj.SCHEMA),
+                   number=NUMBER))
+        report(f'{name}: compiled validator, whole document',
+               timeit.timeit(
+                   lambda: obj._validator.validate(obj.to_dict()),
+                   number=NUMBER))
+        report(f'{name}: compiled validator, changed field',
+               timeit.timeit(
+                   lambda: _validate_with_jsonschema(obj, proposal),
+                   number=NUMBER))
+
+
+if __name__ == '__main__':
+    main()
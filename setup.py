@@ -35,7 +35,8 @@ with open(path.join(here, 'requirements.txt')) as requirements_file:
 
 extras_require = {'client': ['requests'],
                   'server': ['tornado', 'pymongo'],
-                  'local': ['pymongo']}
+                  'local': ['pymongo'],
+                  'async': ['pymongo>=4.13']}
 extras_require['complete'] = sorted(set(sum(extras_require.values(), [])))
 
 setup(